@@ -0,0 +1,118 @@
+import threading
+import time
+import cv2
+
+CAPTURE_BUFFERS = 3  # one being written, the newest frame, and the one the consumer is using
+FPS_SMOOTHING = 0.1  # weight of the newest frame interval in the capture FPS average
+
+
+class CameraCapture:
+    """
+    Reads the camera on its own thread into a small ring of preallocated frame buffers.
+    read() always returns the newest frame; frames nobody read before a newer one arrived are dropped.
+    """
+
+    def __init__(self, device=0, buffer_count=CAPTURE_BUFFERS):
+        self.device = device
+        self.buffer_count = max(buffer_count, 3)
+        self.capture = None
+        self.buffers = []
+        self.thread = None
+        self.running = False
+        self.condition = threading.Condition()
+        self.latest_index = None  # buffer holding the newest frame
+        self.reading_index = None  # buffer handed out by the last read(), not written until the next read()
+        self.latest_sequence = 0  # number of the newest frame, counting from 1
+        self.latest_timestamp = 0.0
+        self.read_sequence = 0  # number of the frame the last read() returned
+        # counters
+        self.frames_captured = 0
+        self.frames_dropped = 0
+        self.capture_fps = 0.0
+        self.frame_age = 0.0  # seconds between capturing and handing out the last frame read
+
+    def start(self):
+        """Opens the camera and starts the capture thread, returns False if the camera can't be read"""
+        self.capture = cv2.VideoCapture(self.device)
+        if not self.capture.isOpened():
+            return False
+        success, frame = self.capture.read()
+        if not success:
+            self.capture.release()
+            return False
+        # every buffer has the camera's frame shape, so cap.read writes into it without allocating
+        self.buffers = [frame] + [frame.copy() for i in range(self.buffer_count - 1)]
+        self.latest_index = 0
+        self.latest_sequence = 1
+        self.latest_timestamp = time.time()
+        self.frames_captured = 1
+        self.running = True
+        self.thread = threading.Thread(target=self._capture_loop, daemon=True)
+        self.thread.start()
+        return True
+
+    @property
+    def frame_size(self):
+        """(width, height) of the camera frames"""
+        height, width = self.buffers[0].shape[:2]
+        return width, height
+
+    def _capture_loop(self):
+        last_timestamp = self.latest_timestamp
+        while self.running:
+            with self.condition:
+                write_index = next(index for index in range(self.buffer_count)
+                                   if index != self.latest_index and index != self.reading_index)
+            success, frame = self.capture.read(self.buffers[write_index])
+            if not success:
+                time.sleep(0.005)
+                continue
+            timestamp = time.time()
+            with self.condition:
+                # the camera may hand back a new array if it changed format, keep whatever it gave us
+                self.buffers[write_index] = frame
+                if self.read_sequence < self.latest_sequence:
+                    self.frames_dropped += 1  # the previous newest frame was never read
+                self.latest_index = write_index
+                self.latest_sequence += 1
+                self.latest_timestamp = timestamp
+                self.frames_captured += 1
+                interval = timestamp - last_timestamp
+                if interval > 0:
+                    fps = 1.0 / interval
+                    self.capture_fps += (fps - self.capture_fps) * FPS_SMOOTHING if self.capture_fps else fps
+                last_timestamp = timestamp
+                self.condition.notify_all()
+
+    def read(self, timeout=1.0):
+        """
+        Waits for a frame newer than the last one read and returns (frame, timestamp), or (None, None)
+        on timeout. The frame stays valid until the next read(), copy it to keep it longer.
+        """
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.latest_sequence > self.read_sequence or not self.running,
+                                           timeout):
+                return None, None
+            if not self.running:
+                return None, None
+            self.reading_index = self.latest_index
+            self.read_sequence = self.latest_sequence
+            self.frame_age = time.time() - self.latest_timestamp
+            return self.buffers[self.reading_index], self.latest_timestamp
+
+    def get_stats(self):
+        """Capture FPS, frames captured and dropped, and the age of the last frame read in seconds"""
+        with self.condition:
+            return {"capture_fps": self.capture_fps, "frames_captured": self.frames_captured,
+                    "frames_dropped": self.frames_dropped, "frame_age": self.frame_age}
+
+    def stop(self):
+        self.running = False
+        with self.condition:
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join(timeout=1.0)
+            self.thread = None
+        if self.capture is not None:
+            self.capture.release()
+            self.capture = None
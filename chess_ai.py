@@ -1,105 +1,538 @@
 """
 Handling the AI moves.
 """
+import multiprocessing
+import os
 import random
-
-piece_score = {"K": 0, "Q": 9, "R": 5, "B": 3, "N": 3, "p": 1}
-
-knight_scores = [[0.0, 0.1, 0.2, 0.2, 0.2, 0.2, 0.1, 0.0],
-                 [0.1, 0.3, 0.5, 0.5, 0.5, 0.5, 0.3, 0.1],
-                 [0.2, 0.5, 0.6, 0.65, 0.65, 0.6, 0.5, 0.2],
-                 [0.2, 0.55, 0.65, 0.7, 0.7, 0.65, 0.55, 0.2],
-                 [0.2, 0.5, 0.65, 0.7, 0.7, 0.65, 0.5, 0.2],
-                 [0.2, 0.55, 0.6, 0.65, 0.65, 0.6, 0.55, 0.2],
-                 [0.1, 0.3, 0.5, 0.55, 0.55, 0.5, 0.3, 0.1],
-                 [0.0, 0.1, 0.2, 0.2, 0.2, 0.2, 0.1, 0.0]]
-
-bishop_scores = [[0.0, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 0.0],
-                 [0.2, 0.4, 0.4, 0.4, 0.4, 0.4, 0.4, 0.2],
-                 [0.2, 0.4, 0.5, 0.6, 0.6, 0.5, 0.4, 0.2],
-                 [0.2, 0.5, 0.5, 0.6, 0.6, 0.5, 0.5, 0.2],
-                 [0.2, 0.4, 0.6, 0.6, 0.6, 0.6, 0.4, 0.2],
-                 [0.2, 0.6, 0.6, 0.6, 0.6, 0.6, 0.6, 0.2],
-                 [0.2, 0.5, 0.4, 0.4, 0.4, 0.4, 0.5, 0.2],
-                 [0.0, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 0.0]]
-
-rook_scores = [[0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25],
-               [0.5, 0.75, 0.75, 0.75, 0.75, 0.75, 0.75, 0.5],
-               [0.0, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.0],
-               [0.0, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.0],
-               [0.0, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.0],
-               [0.0, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.0],
-               [0.0, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.0],
-               [0.25, 0.25, 0.25, 0.5, 0.5, 0.25, 0.25, 0.25]]
-
-queen_scores = [[0.0, 0.2, 0.2, 0.3, 0.3, 0.2, 0.2, 0.0],
-                [0.2, 0.4, 0.4, 0.4, 0.4, 0.4, 0.4, 0.2],
-                [0.2, 0.4, 0.5, 0.5, 0.5, 0.5, 0.4, 0.2],
-                [0.3, 0.4, 0.5, 0.5, 0.5, 0.5, 0.4, 0.3],
-                [0.4, 0.4, 0.5, 0.5, 0.5, 0.5, 0.4, 0.3],
-                [0.2, 0.5, 0.5, 0.5, 0.5, 0.5, 0.4, 0.2],
-                [0.2, 0.4, 0.5, 0.4, 0.4, 0.4, 0.4, 0.2],
-                [0.0, 0.2, 0.2, 0.3, 0.3, 0.2, 0.2, 0.0]]
-
-pawn_scores = [[0.8, 0.8, 0.8, 0.8, 0.8, 0.8, 0.8, 0.8],
-               [0.7, 0.7, 0.7, 0.7, 0.7, 0.7, 0.7, 0.7],
-               [0.3, 0.3, 0.4, 0.5, 0.5, 0.4, 0.3, 0.3],
-               [0.25, 0.25, 0.3, 0.45, 0.45, 0.3, 0.25, 0.25],
-               [0.2, 0.2, 0.2, 0.4, 0.4, 0.2, 0.2, 0.2],
-               [0.25, 0.15, 0.1, 0.2, 0.2, 0.1, 0.15, 0.25],
-               [0.25, 0.3, 0.3, 0.0, 0.0, 0.3, 0.3, 0.25],
-               [0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2]]
-
-piece_position_scores = {"wN": knight_scores,
-                         "bN": knight_scores[::-1],
-                         "wB": bishop_scores,
-                         "bB": bishop_scores[::-1],
-                         "wQ": queen_scores,
-                         "bQ": queen_scores[::-1],
-                         "wR": rook_scores,
-                         "bR": rook_scores[::-1],
-                         "wp": pawn_scores,
-                         "bp": pawn_scores[::-1]}
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from chess_engine import GameState, piece_score
+from opening_book import OpeningBook, BOOK_PATH
+from endgame_tablebase import EndgameTablebases, TABLEBASE_DIRECTORY, WIN, LOSS
 
 CHECKMATE = 1000
 STALEMATE = 0
-DEPTH = 3
+TIME_BUDGET = 1.0  # seconds of wall-clock time the AI may think about one move
+MAX_DEPTH = 32  # iterative deepening stops here even if there is time left
+TIME_CHECK_INTERVAL = 256  # nodes searched between two looks at the clock
+PARALLEL_OVERHEAD = 0.1  # seconds of the budget a parallel search keeps for starting and collecting the workers
+# seconds a search on the opponent's time may run if nobody stops it. A ponder hit is played once it has
+# searched TIME_BUDGET, so little is gained past that, and meanwhile it holds the GIL the frame loop needs
+PONDER_TIME_LIMIT = 2 * TIME_BUDGET
+USE_OPENING_BOOK = True  # play book moves in the opening instead of searching
+TABLEBASE_PIECES = 3  # positions with at most this many pieces, kings included, are looked up in the tablebases
+TABLEBASE_WIN = CHECKMATE / 2  # score of a tablebase win, less one per ply to mate
+
+# move ordering: the hash move first, then captures and promotions by MVV-LVA, then killers, then history
+HASH_MOVE_SCORE = 1000000
+CAPTURE_SCORE = 100000
+KILLER_SCORES = (90000, 80000)
+mvv_lva_values = {"p": 1, "N": 2, "B": 3, "R": 4, "Q": 5, "K": 6}
+DELTA_MARGIN = 2  # a capture that can't raise the score to alpha even with this much extra is not searched
+
+next_move = None
+nodes_searched = 0
+search_deadline = 0.0
+search_stop_event = None
+search_partial_root = False  # the root moves are only a worker's share, the root's result isn't the position's
+root_best_move = None  # best move of the last completed iteration, the root's hash move when search_partial_root
+search_pool = None  # ProcessPoolExecutor of findBestMoveParallel, created by startSearchPool or on first use
+search_pool_size = 0
+search_pool_lock = threading.Lock()  # the pool is started on its own thread while the AI thread may need it
+opening_book = None  # OpeningBook, opened on first use, False if there is no book file
+endgame_tablebases = None  # EndgameTablebases, opened on first use, False if no tables have been generated
+killer_moves = [[None, None] for ply in range(MAX_DEPTH + 1)]  # two quiet moves per ply that caused a cutoff
+history_table = {}  # moveID -> how much the quiet move has cut off the search so far
+
+# transposition table entry flags: the stored score is exact, or only a lower / upper bound of the real one
+EXACT = 0
+LOWER_BOUND = 1
+UPPER_BOUND = 2
+
+
+class TranspositionTable:
+    """
+    Fixed-size table of search results keyed by GameState.zobrist_key.
+    Each slot keeps one entry (key, depth, flag, score, best move, search age); a new result replaces
+    the old one when it was searched at least as deep or the old one is left over from an earlier search.
+    """
+
+    def __init__(self, size_power=18):
+        self.size = 1 << size_power
+        self.mask = self.size - 1
+        self.entries = [None] * self.size
+        self.age = 0
+
+    def newSearch(self):
+        """
+        Called once per AI move, so entries from earlier moves become easy to replace but still usable.
+        """
+        self.age += 1
+
+    def probe(self, key):
+        entry = self.entries[key & self.mask]
+        if entry is not None and entry[0] == key:
+            return entry
+        return None
+
+    def store(self, key, depth, flag, score, move):
+        index = key & self.mask
+        entry = self.entries[index]
+        if entry is None or entry[1] <= depth or entry[5] != self.age:
+            self.entries[index] = (key, depth, flag, score, move, self.age)
+
+    def clear(self):
+        self.entries = [None] * self.size
+        self.age = 0
+
+
+# kept for the whole game, so the search after the human's reply starts from what the last search learned
+transposition_table = TranspositionTable()
 
 
-def findBestMove(game_state, valid_moves, return_queue):
-    global next_move
+class SearchTimeout(Exception):
+    """
+    Raised from inside the search when the time budget runs out or the search is asked to stop.
+    """
+    pass
+
+
+def findBestMove(game_state, valid_moves, return_queue, time_budget=TIME_BUDGET, stop_event=None, randomize=True):
+    """
+    Search for the best move within time_budget seconds and put it on return_queue.
+    stop_event (a threading.Event) aborts the search early.
+    With randomize the root moves are shuffled first, so the AI varies its choice among equally good moves.
+    """
+    if len(valid_moves) <= 1:  # a forced move (or none at all) needs no search
+        return_queue.put(valid_moves[0] if valid_moves else None)
+        return
+    book_move = getBookMove(game_state, valid_moves) or getTablebaseMove(game_state, valid_moves)
+    if book_move is not None:
+        return_queue.put(book_move)
+        return
+    best_move, score, completed_depth = searchIteratively(game_state, valid_moves, time_budget, stop_event,
+                                                          randomize)
+    print(f"AI searched {nodes_searched} nodes, completed depth {completed_depth}")
+    return_queue.put(best_move)
+
+
+def searchIteratively(game_state, valid_moves, time_budget, stop_event=None, randomize=False, partial_root=False):
+    """
+    Iterative deepening: search depth 1, 2, 3, ... until the time budget is spent.
+    Returns the best move of the last completed iteration, its score from the point of view of the side to move
+    and the depth of that iteration.
+    partial_root means valid_moves are only some of the root's moves, so the root isn't stored in the
+    transposition table: its score and best move would be wrong for the position.
+    """
+    global next_move, search_deadline, search_stop_event, nodes_searched, search_partial_root, root_best_move
     next_move = None
-    random.shuffle(valid_moves)
-    findMoveNegaMaxAlphaBeta(game_state, valid_moves, DEPTH, -CHECKMATE, CHECKMATE,
-                             1 if game_state.white_to_move else -1)
-    return_queue.put(next_move)
+    nodes_searched = 0
+    search_deadline = time.time() + time_budget
+    search_stop_event = stop_event
+    search_partial_root = partial_root
+    transposition_table.newSearch()
+    resetMoveOrdering()
+    if randomize:
+        random.shuffle(valid_moves)
+    best_move = valid_moves[0] if valid_moves else None
+    root_best_move = None
+    best_score = -CHECKMATE
+    completed_depth = 0
+    start_length = len(game_state.move_log)
+    for depth in range(1, MAX_DEPTH + 1):
+        next_move = None
+        try:
+            score = findMoveNegaMaxAlphaBeta(game_state, valid_moves, depth, -CHECKMATE, CHECKMATE,
+                                             1 if game_state.white_to_move else -1)
+        except SearchTimeout:
+            # unwind the moves the interrupted iteration was in the middle of
+            while len(game_state.move_log) > start_length:
+                game_state.undoMove()
+            game_state.getValidMoves()  # restore in_check, pins and checks of the root position
+            break
+        completed_depth = depth
+        best_score = score
+        if next_move is not None:
+            best_move = next_move  # also the hash move, so the next iteration searches it first
+            root_best_move = best_move
+        if abs(score) >= CHECKMATE:
+            break  # a forced mate will not change with more depth
+    return best_move, best_score, completed_depth
 
 
-def findMoveNegaMaxAlphaBeta(game_state, valid_moves, depth, alpha, beta, turn_multiplier):
-    global next_move
-    if depth == 0:
+def predictReply(game_state, valid_moves):
+    """
+    The reply the last search expected in this position, from the transposition table, or None.
+    """
+    entry = transposition_table.probe(game_state.zobrist_key)
+    if entry is not None and entry[4] in valid_moves:
+        return valid_moves[valid_moves.index(entry[4])]
+    return None
+
+
+def ponderMove(game_state, results, stop_event, time_limit=PONDER_TIME_LIMIT):
+    """
+    Think on the opponent's time. game_state is the position after our move, with the opponent to move.
+    If the last search expected a reply, search the position after it, otherwise search the opponent's
+    position itself, which at least fills the transposition table for every reply.
+    Runs until stop_event is set or time_limit passes. results gets "key", the Zobrist key of the position
+    after the expected reply (None without one), and when the search ends its "move", "score", "depth"
+    and "time", the seconds it searched.
+    """
+    valid_moves = game_state.getValidMoves()
+    predicted_reply = predictReply(game_state, valid_moves)
+    results["key"] = None
+    if predicted_reply is not None:
+        game_state.makeMove(predicted_reply)
+        valid_moves = game_state.getValidMoves()
+        results["key"] = game_state.zobrist_key
+    if not valid_moves:
+        return
+    start_time = time.time()
+    best_move, score, completed_depth = searchIteratively(game_state, valid_moves, time_limit, stop_event)
+    results.update(move=best_move, score=score, depth=completed_depth, time=time.time() - start_time)
+
+
+def findBestMoveParallel(game_state, valid_moves, return_queue, time_budget=TIME_BUDGET, processes=None):
+    """
+    Root-parallel search: deal the root moves out to worker processes, each of which rebuilds the position
+    and searches its share with iterative deepening, then put the move with the best score on return_queue.
+    Pure Python search is limited to one core by the GIL, this uses as many cores as there are processes.
+    If a worker fails, the move is searched in this process with what is left of the time budget.
+    """
+    global search_pool
+    if len(valid_moves) <= 1:
+        return_queue.put(valid_moves[0] if valid_moves else None)
+        return
+    book_move = getBookMove(game_state, valid_moves) or getTablebaseMove(game_state, valid_moves)
+    if book_move is not None:
+        return_queue.put(book_move)
+        return
+    start_time = time.time()
+    processes = processes or os.cpu_count() or 1
+    pool = getSearchPool(processes)
+    # deal moves out in order of promise, so every worker gets some of the likely best moves
+    entry = transposition_table.probe(game_state.zobrist_key)
+    orderMoves(valid_moves, entry[4] if entry is not None else None, 0)
+    shares = [valid_moves[i::processes] for i in range(processes)]
+    position = game_state.to_fen()
+    # leave the workers a little time to set up the position and send their answer back
+    worker_budget = max(time_budget - PARALLEL_OVERHEAD, time_budget / 2)
+    try:
+        futures = [pool.submit(searchRootMoves, position, [move.moveID for move in share], worker_budget)
+                   for share in shares if share]
+        results = [future.result() for future in futures]
+    except Exception as error:
+        # without a move on return_queue the game would wait for the AI forever
+        print(f"Parallel search failed ({error!r}), searching in this process")
+        if isinstance(error, BrokenProcessPool):  # a worker died, the pool takes no more work
+            with search_pool_lock:
+                if search_pool is pool:
+                    search_pool = None
+            pool.shutdown(wait=False)
+        findBestMove(game_state, valid_moves, return_queue,
+                     max(time_budget - (time.time() - start_time), time_budget / 4))
+        return
+    best_move, best_score = valid_moves[0], -CHECKMATE - 1
+    for move_id, score, completed_depth in results:
+        if move_id is not None and score > best_score:
+            best_score = score
+            best_move = next(move for move in valid_moves if move.moveID == move_id)
+    print(f"AI searched {len(futures)} shares of root moves in parallel, best score {best_score}")
+    return_queue.put(best_move)
+
+
+def getBookMove(game_state, valid_moves):
+    """
+    A move from the opening book for the position, or None if the book has none (or is turned off or missing).
+    """
+    global opening_book
+    if not USE_OPENING_BOOK:
+        return None
+    if opening_book is None:
+        try:
+            opening_book = OpeningBook(BOOK_PATH)
+        except OSError as error:
+            print(f"No opening book: {error}")
+            opening_book = False
+    if not opening_book:
+        return None
+    book_move = opening_book.chooseMove(game_state, valid_moves)
+    if book_move is not None:
+        print(f"AI played {book_move.getChessNotation()} from the opening book")
+    return book_move
+
+
+def probeTablebases(game_state, ply=0):
+    """
+    Score of the position from the tablebases, from the point of view of the side to move,
+    or None if it has too many pieces or there is no table for it.
+    ply is the distance from the root, so a quicker mate scores higher wherever in the tree it is found.
+    """
+    global endgame_tablebases
+    occupied = game_state.color_bitboards["w"] | game_state.color_bitboards["b"]
+    if bin(occupied).count("1") > TABLEBASE_PIECES:
+        return None
+    if endgame_tablebases is None:
+        endgame_tablebases = EndgameTablebases(TABLEBASE_DIRECTORY)
+        if not endgame_tablebases.tables:
+            print("No endgame tablebases, run endgame_tablebase.py to generate them")
+            endgame_tablebases = False
+    if not endgame_tablebases:
+        return None
+    probe = endgame_tablebases.probe(game_state)
+    if probe is None:
+        return None
+    result, plies = probe
+    if result == WIN:
+        return TABLEBASE_WIN - ply - plies
+    if result == LOSS:
+        return -TABLEBASE_WIN + ply + plies
+    return STALEMATE
+
+
+def getTablebaseMove(game_state, valid_moves):
+    """
+    The move the tablebases rate best (the fastest mate, the slowest loss), or None when the position
+    or one of its replies is not in them.
+    """
+    if probeTablebases(game_state) is None:
+        return None
+    best_move, best_score = None, None
+    for move in valid_moves:
+        game_state.makeMove(move)
+        if not game_state.getValidMoves():  # mate or stalemate are not looked up
+            score = -(1 if game_state.white_to_move else -1) * scoreBoard(game_state)
+        else:
+            score = probeTablebases(game_state, 1)
+            score = None if score is None else -score
+        game_state.undoMove()
+        if score is None:
+            return None
+        if best_score is None or score > best_score:
+            best_move, best_score = move, score
+    print(f"AI played {best_move.getChessNotation()} from the tablebases, score {best_score}")
+    return best_move
+
+
+def getSearchPool(processes):
+    """
+    The worker processes are started once and reused, each one keeps its own transposition table warm.
+    They are spawned rather than forked, so they don't inherit the camera and display of the main process,
+    and main.py imports its camera, display and hand tracking modules inside main() so they aren't re-imported here.
+    """
+    global search_pool, search_pool_size
+    with search_pool_lock:
+        if search_pool is not None and search_pool_size != processes:
+            search_pool.shutdown(wait=False)
+            search_pool = None
+        if search_pool is None:
+            search_pool = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn"))
+            search_pool_size = processes
+        return search_pool
+
+
+def startSearchPool(processes=None):
+    """
+    Start the worker processes before the first parallel search, which would otherwise spend its time budget
+    spawning them and importing this module in each. The pool starts a process for every job submitted while
+    none is idle, so one job per worker starts them all. Blocks until they are running.
+    """
+    processes = processes or os.cpu_count() or 1
+    pool = getSearchPool(processes)
+    for future in [pool.submit(warmUpWorker) for i in range(processes)]:
+        future.result()
+
+
+def warmUpWorker():
+    """Worker process entry point of startSearchPool, running it imports this module and the engine's tables."""
+    return os.getpid()
+
+
+def searchRootMoves(position, move_ids, time_budget):
+    """
+    Worker process entry point: search only the root moves in move_ids and report (moveID, score, depth).
+    """
+    game_state = GameState.from_fen(position)
+    all_moves = game_state.getValidMoves()
+    valid_moves = [move for move in all_moves if move.moveID in move_ids]
+    if not valid_moves:
+        return None, -CHECKMATE, 0
+    best_move, score, completed_depth = searchIteratively(game_state, valid_moves, time_budget,
+                                                          partial_root=len(valid_moves) < len(all_moves))
+    return best_move.moveID, score, completed_depth
+
+
+def resetMoveOrdering():
+    """
+    Forget the killers of the previous search, their plies meant other positions, and age the history.
+    """
+    for killers in killer_moves:
+        killers[0] = killers[1] = None
+    for move_id in history_table:
+        history_table[move_id] //= 2
+
+
+def orderMoves(moves, hash_move, ply):
+    """
+    Sort moves in place so the ones most likely to cause a cutoff are searched first.
+    The sort is stable, so moves with equal order scores keep their current (possibly shuffled) order.
+    """
+    first_killer, second_killer = killer_moves[ply]
+
+    def moveOrderScore(move):
+        if move == hash_move:
+            return HASH_MOVE_SCORE
+        if move.is_capture:  # most valuable victim first, then least valuable attacker
+            return CAPTURE_SCORE + 10 * mvv_lva_values[move.piece_captured[1]] - mvv_lva_values[move.piece_moved[1]]
+        if move.is_pawn_promotion:
+            return CAPTURE_SCORE + 10 * mvv_lva_values[move.promotion_piece]
+        if move == first_killer:
+            return KILLER_SCORES[0]
+        if move == second_killer:
+            return KILLER_SCORES[1]
+        return history_table.get(move.moveID, 0)
+
+    moves.sort(key=moveOrderScore, reverse=True)
+
+
+def storeCutoffMove(move, depth, ply):
+    """
+    Remember a quiet move that caused a beta cutoff as a killer for this ply and in the history table.
+    """
+    killers = killer_moves[ply]
+    if move != killers[0]:
+        killers[1] = killers[0]
+        killers[0] = move
+    history_table[move.moveID] = history_table.get(move.moveID, 0) + depth * depth
+
+
+def checkSearchTime():
+    if time.time() >= search_deadline or (search_stop_event is not None and search_stop_event.is_set()):
+        raise SearchTimeout()
+
+
+def findMoveNegaMaxAlphaBeta(game_state, valid_moves, depth, alpha, beta, turn_multiplier, ply=0):
+    global next_move, nodes_searched
+    nodes_searched += 1
+    if nodes_searched % TIME_CHECK_INTERVAL == 0:
+        checkSearchTime()
+    if len(valid_moves) == 0:  # checkmate or stalemate
         return turn_multiplier * scoreBoard(game_state)
-    # move ordering - implement later //TODO
+    if ply != 0:
+        tablebase_score = probeTablebases(game_state, ply)
+        if tablebase_score is not None:  # the exact result, no need to search any further
+            return tablebase_score
+    if depth == 0:
+        if game_state.in_check:
+            return findMoveQuiescence(game_state, valid_moves, alpha, beta, turn_multiplier)
+        captures = [move for move in valid_moves if move.is_capture or move.promotion_piece == "Q"]
+        return findMoveQuiescence(game_state, captures, alpha, beta, turn_multiplier)
+    key = game_state.zobrist_key
+    original_alpha = alpha
+    entry = transposition_table.probe(key)
+    hash_move = None
+    if entry is not None:
+        hash_move = entry[4]
+    if ply == 0 and search_partial_root:  # the root is never stored, the last iteration's best goes first
+        hash_move = root_best_move
+    if entry is not None and entry[1] >= depth and ply != 0:  # the root still has to pick next_move
+        flag, score = entry[2], entry[3]
+        if flag == EXACT:
+            return score
+        if flag == LOWER_BOUND:
+            alpha = max(alpha, score)
+        else:
+            beta = min(beta, score)
+        if alpha >= beta:
+            return score
+    orderMoves(valid_moves, hash_move, ply)
     max_score = -CHECKMATE
+    best_move = None
     for move in valid_moves:
         game_state.makeMove(move)
         next_moves = game_state.getValidMoves()
-        score = -findMoveNegaMaxAlphaBeta(game_state, next_moves, depth - 1, -beta, -alpha, -turn_multiplier)
+        score = -findMoveNegaMaxAlphaBeta(game_state, next_moves, depth - 1, -beta, -alpha, -turn_multiplier,
+                                          ply + 1)
         if score > max_score:
             max_score = score
-            if depth == DEPTH:
+            best_move = move
+            if ply == 0:
                 next_move = move
         game_state.undoMove()
         if max_score > alpha:
             alpha = max_score
         if alpha >= beta:
+            if not move.is_capture:
+                storeCutoffMove(move, depth, ply)
             break
+    if max_score <= original_alpha:
+        flag = UPPER_BOUND
+    elif max_score >= beta:
+        flag = LOWER_BOUND
+    else:
+        flag = EXACT
+    if ply != 0 or not search_partial_root:
+        transposition_table.store(key, depth, flag, max_score, best_move)
     return max_score
 
 
+def findMoveQuiescence(game_state, valid_moves, alpha, beta, turn_multiplier):
+    """
+    Keep searching captures and promotions past the horizon until the position is quiet, so the search
+    never stops in the middle of an exchange. valid_moves are the captures (all moves when in check).
+    """
+    global nodes_searched
+    nodes_searched += 1
+    if nodes_searched % TIME_CHECK_INTERVAL == 0:
+        checkSearchTime()
+    if game_state.checkmate or game_state.stalemate:
+        return turn_multiplier * scoreBoard(game_state)
+    if game_state.in_check:  # every evasion has to be searched, standing pat is not an option
+        stand_pat = max_score = -CHECKMATE
+    else:
+        # stand pat: the side to move doesn't have to capture, so the static score is a lower bound
+        stand_pat = max_score = turn_multiplier * scoreBoard(game_state)
+        if stand_pat >= beta:
+            return stand_pat
+        if stand_pat > alpha:
+            alpha = stand_pat
+    orderCaptures(valid_moves)
+    for move in valid_moves:
+        if stand_pat > -CHECKMATE:
+            if move.is_pawn_promotion:
+                if move.promotion_piece != "Q":  # under-promotions are left to the main search
+                    continue
+            # delta pruning: skip captures that can't bring the score back up to alpha
+            elif stand_pat + piece_score[move.piece_captured[1]] + DELTA_MARGIN <= alpha:
+                continue
+        game_state.makeMove(move)
+        next_moves = game_state.getCaptureMoves()
+        score = -findMoveQuiescence(game_state, next_moves, -beta, -alpha, -turn_multiplier)
+        game_state.undoMove()
+        if score > max_score:
+            max_score = score
+        if max_score > alpha:
+            alpha = max_score
+        if alpha >= beta:
+            break
+    return max_score
+
+
+def orderCaptures(moves):
+    """
+    Sort captures by MVV-LVA, quiet check evasions go last.
+    """
+    moves.sort(key=lambda move: 10 * mvv_lva_values[move.piece_captured[1]] - mvv_lva_values[move.piece_moved[1]]
+               if move.is_capture else -10, reverse=True)
+
+
 def scoreBoard(game_state):
     """
     Score the board. A positive score is good for white, a negative score is good for black.
+    The material and piece position score is kept up to date by the GameState as pieces move.
     """
     if game_state.checkmate:
         if game_state.white_to_move:
@@ -108,20 +541,7 @@ def scoreBoard(game_state):
             return CHECKMATE  # white wins
     elif game_state.stalemate:
         return STALEMATE
-    score = 0
-    for row in range(len(game_state.board)):
-        for col in range(len(game_state.board[row])):
-            piece = game_state.board[row][col]
-            if piece != "--":
-                piece_position_score = 0
-                if piece[1] != "K":
-                    piece_position_score = piece_position_scores[piece][row][col]
-                if piece[0] == "w":
-                    score += piece_score[piece[1]] + piece_position_score
-                if piece[0] == "b":
-                    score -= piece_score[piece[1]] + piece_position_score
-
-    return score
+    return game_state.score / 100
 
 
 def findRandomMove(valid_moves):
@@ -129,16 +549,3 @@ def findRandomMove(valid_moves):
     Picks and returns a random valid move.
     """
     return random.choice(valid_moves)
-
-
-def findBestMove(gs, valid_moves, move_queue, depth=2):
-    """Find the best move using minimax algorithm with alpha-beta pruning"""
-    # Start with a random move as fallback
-    if valid_moves:
-        best_move = random.choice(valid_moves)
-        move_queue.put(best_move)
-        
-        # For simple implementation, return a random move for now
-        # In a full implementation, this would use minimax algorithm
-        return
-    return None
\ No newline at end of file
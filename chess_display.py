@@ -1,95 +1,166 @@
 import pygame
 import os
 
-IMAGES = {}  
+IMAGES = {}  # piece images at the current square size
+SOURCE_IMAGES = {}  # the piece images as loaded
+SCALED_IMAGES = {}  # square size -> piece images scaled to it
 
+# the layout was made for this square size, text sizes and margins scale with the square size
+REFERENCE_SQUARE_SIZE = 200
 SQUARE_SIZE = 200  
 BOARD_SIZE = 8 * SQUARE_SIZE
 screen = None
 piece_font = None
 status_font = None
+glow_surface = None
 
 piece_colors = {"p": "white", "r": "white", "n": "white", "b": "white", "q": "white", "k": "white",
                 "P": "black", "R": "black", "N": "black", "B": "black", "Q": "black", "K": "black"}
 
+BOARD_COLORS = [(205, 133, 63, 128), (245, 222, 179, 128)]  # Brown and Beige with alpha (transparency)
+HIGHLIGHT_COLOR = (0, 255, 0, 80)  # Semi-transparent green
+CHECK_COLOR = (255, 0, 0, 100)  # Semi-transparent red
+# the dynamic layers, bottom to top
+LAYERS = ("highlights", "check", "status", "thinking", "drag")
+
+# the static layer: squares and pieces, only redrawn when the position changes
+board_layer = None
+board_layer_key = None  # position the layer was drawn for
+board_layer_board = None  # the board it shows
+board_layer_changed = False
+# the dynamic layers: name -> (signature, rects, draw function), what's on the screen and what this frame wants
+drawn_layers = {}
+frame_layers = {}
+text_surfaces = {}  # (text, background color) -> rendered text and its background box
+
 def load_chess_images():
-    """Load all chess piece images"""
+    """Load all chess piece images, once, and scale them to the square size"""
     global IMAGES
     pieces = ['wp', 'wR', 'wN', 'wB', 'wK', 'wQ', 'bp', 'bR', 'bN', 'bB', 'bK', 'bQ']
     for piece in pieces:
+        if piece in SOURCE_IMAGES:
+            continue
         try:
             img_path = os.path.join("images", piece + ".png")
             print(f"Loading image: {img_path}")
-            image = pygame.image.load(img_path)
-            IMAGES[piece] = pygame.transform.scale(image, (SQUARE_SIZE, SQUARE_SIZE))
+            SOURCE_IMAGES[piece] = pygame.image.load(img_path)
         except pygame.error as e:
             print(f"Error loading {piece}.png: {e}")
-            IMAGES[piece] = None  # Set to None to indicate failed loading
+            SOURCE_IMAGES[piece] = None  # Set to None to indicate failed loading
+    IMAGES = get_scaled_images(SQUARE_SIZE)
     
     print(f"Loaded {len(IMAGES)} images: {list(IMAGES.keys())}")
 
-def init_transparent_display():
-    global screen, piece_font, status_font
+def get_scaled_images(size):
+    """The piece images scaled to size, scaled once per size"""
+    if size not in SCALED_IMAGES:
+        SCALED_IMAGES[size] = {piece: pygame.transform.smoothscale(image, (size, size)) if image else None
+                               for piece, image in SOURCE_IMAGES.items()}
+    return SCALED_IMAGES[size]
+
+def scale_layout(value):
+    """A size or margin of the layout, scaled to the current square size"""
+    return max(1, round(value * SQUARE_SIZE / REFERENCE_SQUARE_SIZE))
+
+def init_transparent_display(output_size=None):
+    """
+    Creates the surface the board is drawn on. With output_size (width, height), e.g. the camera frame size,
+    the surface has that size and the board fills its height (or width, if narrower) from the top left corner,
+    so the surface can be put on the output without scaling. Without, it's the old 1600x1850 surface.
+    """
+    global screen, piece_font, status_font, glow_surface, SQUARE_SIZE, BOARD_SIZE
+    global board_layer, board_layer_key, drawn_layers, frame_layers, text_surfaces
     pygame.init()
+    if output_size:
+        screen_width, screen_height = output_size
+        SQUARE_SIZE = min(screen_width, screen_height) // 8
+    else:
+        SQUARE_SIZE = REFERENCE_SQUARE_SIZE
+        screen_width, screen_height = 8 * SQUARE_SIZE, 8 * SQUARE_SIZE + 250
+    BOARD_SIZE = 8 * SQUARE_SIZE
     # Create a surface without opening a window
-    screen_height = BOARD_SIZE + 250 
-    screen_width = BOARD_SIZE
     screen = pygame.Surface((screen_width, screen_height), pygame.SRCALPHA)
-    piece_font = pygame.font.Font(None, 120)
-    status_font = pygame.font.Font(None, 60)
+    piece_font = pygame.font.Font(None, scale_layout(120))
+    status_font = pygame.font.Font(None, scale_layout(60))
+    glow_surface = pygame.Surface((SQUARE_SIZE, SQUARE_SIZE), pygame.SRCALPHA)
+    pygame.draw.circle(glow_surface, (255, 255, 255, 80), (SQUARE_SIZE // 2, SQUARE_SIZE // 2), SQUARE_SIZE // 2.5)
+    # everything drawn for the previous size is redrawn
+    board_layer = board_layer_key = None
+    drawn_layers, frame_layers, text_surfaces = {}, {}, {}
     
     # Load images during initialization
     load_chess_images()
     
     return screen   
 
-def draw_transparent_board(screen, board, valid_moves=None, in_check=False, king_pos=None):
-    colors = [(205, 133, 63, 128), (245, 222, 179, 128)]  # Brown and Beige with alpha (transparency)
-    for row in range(8):
-        for col in range(8):
-            # Draw base square
-            color = colors[(row + col) % 2]
-            pygame.draw.rect(screen, color, (col * SQUARE_SIZE, row * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE))
-            
-            # Highlight valid moves if provided
-            if valid_moves:
-                for move in valid_moves:
-                    if move.end_row == row and move.end_col == col:
-                        # Draw highlight circle for valid move destination
-                        highlight_color = (0, 255, 0, 80)  # Semi-transparent green
-                        pygame.draw.circle(screen, highlight_color, 
-                                          (col * SQUARE_SIZE + SQUARE_SIZE // 2, 
-                                           row * SQUARE_SIZE + SQUARE_SIZE // 2), 
-                                          SQUARE_SIZE // 4)
-            
-            # Draw pieces using images
-            piece = board[row][col]
-            if piece:
-                # Convert piece notation to image key
-                if piece.islower():  # Black pieces
-                    piece_type = piece.upper() if piece != 'p' else 'p'  # Keep pawn lowercase
-                    img_key = "b" + piece_type
-                else:  # White pieces
-                    piece_type = piece if piece != 'P' else 'p'  # Keep pawn lowercase
-                    img_key = "w" + piece_type
-                
-                # Get the image from main's IMAGES dictionary
-                if img_key in IMAGES:
-                    piece_img = IMAGES[img_key]
-                    # Position the image correctly on the board
-                    piece_rect = piece_img.get_rect(center=(
-                        col * SQUARE_SIZE + SQUARE_SIZE // 2,
-                        row * SQUARE_SIZE + SQUARE_SIZE // 2
-                    ))
-                    screen.blit(piece_img, piece_rect)
+def get_image_key(piece):
+    # Convert piece notation to image key
+    if piece.islower():  # Black pieces
+        piece_type = piece.upper() if piece != 'p' else 'p'  # Keep pawn lowercase
+        return "b" + piece_type
+    piece_type = piece if piece != 'P' else 'p'  # Keep pawn lowercase
+    return "w" + piece_type
+
+def get_square_rect(row, col):
+    return pygame.Rect(col * SQUARE_SIZE, row * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE)
+
+def draw_square(surface, row, col, piece, highlighted=False):
+    """Draws one square from scratch: its color, the valid move circle and the piece"""
+    pygame.draw.rect(surface, BOARD_COLORS[(row + col) % 2], get_square_rect(row, col))
+    center = (col * SQUARE_SIZE + SQUARE_SIZE // 2, row * SQUARE_SIZE + SQUARE_SIZE // 2)
+    if highlighted:
+        pygame.draw.circle(surface, HIGHLIGHT_COLOR, center, SQUARE_SIZE // 4)
+    if piece:
+        piece_img = IMAGES.get(get_image_key(piece))
+        if piece_img:
+            surface.blit(piece_img, piece_img.get_rect(center=center))
+
+def draw_transparent_board(screen, board, valid_moves=None, in_check=False, king_pos=None, position_id=None):
+    """
+    Starts a frame: redraws the static board layer if the position changed (position_id, e.g.
+    game_state.get_position_id(), or else the board itself, tells) and sets the highlights and check overlay.
+    Nothing reaches the screen until update_transparent_display.
+    """
+    global board_layer, board_layer_key, board_layer_board, board_layer_changed
+    key = position_id if position_id is not None else [row[:] for row in board]
+    if board_layer is None or key != board_layer_key:
+        if board_layer is None:
+            board_layer = pygame.Surface(screen.get_size(), pygame.SRCALPHA)
+        board_layer.fill((0, 0, 0, 0))
+        for row in range(8):
+            for col in range(8):
+                draw_square(board_layer, row, col, board[row][col])
+        board_layer_key = key
+        board_layer_board = [row[:] for row in board]
+        board_layer_changed = True
+
+    # Highlight valid moves if provided
+    targets = tuple(sorted({(move.end_row, move.end_col) for move in valid_moves or ()}))
+    if targets:
+        def draw_highlights():
+            for row, col in targets:
+                draw_square(screen, row, col, board_layer_board[row][col], True)
+        frame_layers["highlights"] = (targets, [get_square_rect(row, col) for row, col in targets], draw_highlights)
 
     # Highlight king if in check
     if in_check and king_pos:
-        king_row, king_col = king_pos
-        check_color = (255, 0, 0, 100)  # Semi-transparent red
-        pygame.draw.rect(screen, check_color, 
-                        (king_col * SQUARE_SIZE, king_row * SQUARE_SIZE, 
-                         SQUARE_SIZE, SQUARE_SIZE))
+        check_rect = get_square_rect(*king_pos)
+        frame_layers["check"] = (tuple(king_pos), [check_rect],
+                                 lambda: pygame.draw.rect(screen, CHECK_COLOR, check_rect))
+
+def get_text_surfaces(text, background):
+    """The rendered text and its background box, rendered once per text"""
+    if (text, background) not in text_surfaces:
+        text_surface = status_font.render(text, True, (255, 255, 255))
+        text_bg = pygame.Surface((text_surface.get_width() + scale_layout(20), text_surface.get_height() + scale_layout(10)),
+                                 pygame.SRCALPHA)
+        text_bg.fill(background)
+        text_surfaces[(text, background)] = text_surface, text_bg
+    return text_surfaces[(text, background)]
+
+def draw_text_box(screen, text_surface, text_bg, position):
+    screen.blit(text_bg, position)
+    screen.blit(text_surface, (position[0] + scale_layout(10), position[1] + scale_layout(5)))
 
 def draw_game_status(screen, checkmate=False, stalemate=False, white_to_move=True, ai_enabled=False, ai_thinking=False):
     status_text = ""
@@ -103,44 +174,61 @@ def draw_game_status(screen, checkmate=False, stalemate=False, white_to_move=Tru
         status_text = "Black to move" + (" (AI)" if ai_enabled else "")
         
     if status_text:
-        text_surface = status_font.render(status_text, True, (255, 255, 255))
-        text_bg = pygame.Surface((text_surface.get_width() + 20, text_surface.get_height() + 10), pygame.SRCALPHA)
-        text_bg.fill((0, 0, 0, 180))
-        screen.blit(text_bg, (10, 10))
-        screen.blit(text_surface, (20, 15))
+        text_surface, text_bg = get_text_surfaces(status_text, (0, 0, 0, 180))
+        status_rect = text_bg.get_rect(topleft=(scale_layout(10), scale_layout(10)))
+        frame_layers["status"] = (status_text, [status_rect],
+                                  lambda: draw_text_box(screen, text_surface, text_bg, status_rect.topleft))
         
     # Show AI thinking indicator
     if ai_thinking:
-        thinking_text = "AI is thinking..."
-        think_surface = status_font.render(thinking_text, True, (255, 255, 255))
-        think_bg = pygame.Surface((think_surface.get_width() + 20, think_surface.get_height() + 10), pygame.SRCALPHA)
-        think_bg.fill((50, 50, 200, 180))
-        screen.blit(think_bg, (BOARD_SIZE - think_surface.get_width() - 30, 10))
-        screen.blit(think_surface, (BOARD_SIZE - think_surface.get_width() - 20, 15))
+        think_surface, think_bg = get_text_surfaces("AI is thinking...", (50, 50, 200, 180))
+        think_rect = think_bg.get_rect(topright=(BOARD_SIZE - scale_layout(10), scale_layout(10)))
+        frame_layers["thinking"] = (True, [think_rect],
+                                    lambda: draw_text_box(screen, think_surface, think_bg, think_rect.topleft))
 
 def draw_transparent_dragging_piece(screen, piece, center):
     if piece:
-        # Convert piece to image key
-        if piece.islower():  # Black pieces
-            piece_type = piece.upper() if piece != 'p' else 'p'
-            img_key = "b" + piece_type
-        else:  # White pieces
-            piece_type = piece if piece != 'P' else 'p'
-            img_key = "w" + piece_type
-            
         # Get the image from the main module
-        if img_key in IMAGES:
-            piece_img = IMAGES[img_key]
-            # Add glow effect
-            glow_surface = pygame.Surface((SQUARE_SIZE, SQUARE_SIZE), pygame.SRCALPHA)
-            pygame.draw.circle(glow_surface, (255, 255, 255, 80), 
-                             (SQUARE_SIZE // 2, SQUARE_SIZE // 2), 
-                             SQUARE_SIZE // 2.5)
-            
-            # Position the image at the cursor
-            piece_rect = piece_img.get_rect(center=center)
-            screen.blit(glow_surface, (piece_rect.x, piece_rect.y))
-            screen.blit(piece_img, piece_rect)
+        piece_img = IMAGES.get(get_image_key(piece))
+        if piece_img:
+            # Position the image at the cursor, with a glow effect behind it
+            piece_rect = piece_img.get_rect(center=(int(center[0]), int(center[1])))
+            def draw_drag():
+                screen.blit(glow_surface, piece_rect.topleft)
+                screen.blit(piece_img, piece_rect)
+            frame_layers["drag"] = ((piece, piece_rect.topleft), [piece_rect], draw_drag)
+
+def update_transparent_display(screen):
+    """
+    Ends a frame: puts this frame's board and dynamic layers on the screen, redrawing only the rectangles
+    whose layers changed since the last frame. Returns those rectangles.
+    """
+    global drawn_layers, frame_layers, board_layer_changed
+    screen_rect = screen.get_rect()
+    if board_layer_changed:
+        dirty_rects = [screen_rect]
+        board_layer_changed = False
+    else:
+        dirty_rects = []
+        for name in LAYERS:
+            drawn, wanted = drawn_layers.get(name), frame_layers.get(name)
+            if (drawn and drawn[0]) != (wanted and wanted[0]):
+                for layer in (drawn, wanted):
+                    if layer:
+                        dirty_rects.extend(rect.clip(screen_rect) for rect in layer[1])
+    for dirty_rect in dirty_rects:
+        # put the board back under the rectangle, then every layer touching it, clipped to it
+        screen.set_clip(dirty_rect)
+        screen.fill((0, 0, 0, 0), dirty_rect)  # blitting onto transparent pixels copies them
+        screen.blit(board_layer, dirty_rect, dirty_rect)
+        for name in LAYERS:
+            layer = frame_layers.get(name)
+            if layer and dirty_rect.collidelist(layer[1]) != -1:
+                layer[2]()
+    screen.set_clip(None)
+    drawn_layers = frame_layers
+    frame_layers = {}
+    return dirty_rects
 
 def screen_to_board(x, y):
     col = x // SQUARE_SIZE
@@ -152,6 +240,10 @@ def screen_to_board(x, y):
 def quit_display():
     pygame.quit()
 
+def get_square_size():
+    """Return the square size after initialization"""
+    return SQUARE_SIZE
+
 def get_status_font():
     """Return the status font after initialization"""
     global status_font
@@ -3,6 +3,224 @@ Storing all the information about the current state of chess game.
 Determining valid moves at current state.
 It will keep move log.
 """
+import random
+
+# Bitboards use the same square order as the board list: square = row * 8 + col,
+# so square 0 is a8 (top left corner) and square 63 is h1 (bottom right corner).
+# Bit number `square` of a bitboard is set when that square belongs to the set.
+# one letter per piece, upper case for white, as in FEN
+PIECE_LETTERS = {"wp": "P", "wR": "R", "wN": "N", "wB": "B", "wQ": "Q", "wK": "K",
+                 "bp": "p", "bR": "r", "bN": "n", "bB": "b", "bQ": "q", "bK": "k"}
+LETTER_PIECES = {letter: piece for piece, letter in PIECE_LETTERS.items()}
+
+ALL_SQUARES = (1 << 64) - 1
+SQUARE_BITS = [1 << square for square in range(64)]
+SQUARE_COORDINATES = [(square // 8, square % 8) for square in range(64)]
+
+# same order as the ray scan in checkForPinsAndChecks: the first 4 are orthogonal, the last 4 diagonal
+DIRECTIONS = ((-1, 0), (0, -1), (1, 0), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1))
+DIRECTION_INDEX = {direction: j for j, direction in enumerate(DIRECTIONS)}
+OPPOSITE_DIRECTION = (2, 3, 0, 1, 7, 6, 5, 4)
+RANK_BITS = [0xFF << (row * 8) for row in range(8)]  # indexed by board row, not by chess rank
+FILE_BITS = [0x0101010101010101 << col for col in range(8)]
+PROMOTION_SQUARES = RANK_BITS[0] | RANK_BITS[7]
+
+ORTHOGONAL_DIRECTIONS = (0, 1, 2, 3)
+DIAGONAL_DIRECTIONS = (4, 5, 6, 7)
+# rays in these directions run towards higher square numbers, so their nearest blocker is the lowest set bit
+POSITIVE_DIRECTIONS = (False, False, True, True, False, False, True, True)
+KNIGHT_OFFSETS = ((-2, -1), (-2, 1), (-1, 2), (1, 2), (2, -1), (2, 1), (-1, -2), (1, -2))
+
+
+def buildStepAttacks(offsets):
+    """
+    Precompute, for every square, the mask of squares reachable with a single step from offsets.
+    """
+    attacks = []
+    for row, col in SQUARE_COORDINATES:
+        mask = 0
+        for row_offset, col_offset in offsets:
+            end_row = row + row_offset
+            end_col = col + col_offset
+            if 0 <= end_row <= 7 and 0 <= end_col <= 7:
+                mask |= SQUARE_BITS[end_row * 8 + end_col]
+        attacks.append(mask)
+    return attacks
+
+
+def buildRays():
+    """
+    Precompute, for every direction and square, the mask of squares up to the edge of the board.
+    """
+    rays = []
+    for row_offset, col_offset in DIRECTIONS:
+        direction_rays = []
+        for row, col in SQUARE_COORDINATES:
+            mask = 0
+            end_row = row + row_offset
+            end_col = col + col_offset
+            while 0 <= end_row <= 7 and 0 <= end_col <= 7:
+                mask |= SQUARE_BITS[end_row * 8 + end_col]
+                end_row += row_offset
+                end_col += col_offset
+            direction_rays.append(mask)
+        rays.append(direction_rays)
+    return rays
+
+
+KNIGHT_ATTACKS = buildStepAttacks(KNIGHT_OFFSETS)
+KING_ATTACKS = buildStepAttacks(DIRECTIONS)
+# squares attacked by a pawn of the given color standing on a square
+PAWN_ATTACKS = {"w": buildStepAttacks(((-1, -1), (-1, 1))), "b": buildStepAttacks(((1, -1), (1, 1)))}
+RAYS = buildRays()
+
+# Zobrist hashing: every (piece, square), the side to move, each castling right and each en-passant file
+# gets a random 64-bit number, and a position's key is the XOR of the numbers of everything in it.
+# The generator is seeded so keys are identical between runs and processes.
+zobrist_random = random.Random(20240613)
+ZOBRIST_PIECES = {color + piece_type: [zobrist_random.getrandbits(64) for square in range(64)]
+                  for color in "wb" for piece_type in "pRNBQK"}
+ZOBRIST_BLACK_TO_MOVE = zobrist_random.getrandbits(64)
+ZOBRIST_CASTLING = {right: zobrist_random.getrandbits(64) for right in ("wks", "bks", "wqs", "bqs")}
+ZOBRIST_ENPASSANT = [zobrist_random.getrandbits(64) for col in range(8)]
+
+# castling rights are kept as a 4-bit integer, one bit per right
+WHITE_KINGSIDE = 1
+BLACK_KINGSIDE = 2
+WHITE_QUEENSIDE = 4
+BLACK_QUEENSIDE = 8
+ALL_CASTLING_RIGHTS = WHITE_KINGSIDE | BLACK_KINGSIDE | WHITE_QUEENSIDE | BLACK_QUEENSIDE
+CASTLING_BITS = {"wks": WHITE_KINGSIDE, "bks": BLACK_KINGSIDE, "wqs": WHITE_QUEENSIDE, "bqs": BLACK_QUEENSIDE}
+# Zobrist number of every combination of rights, the XOR of the numbers of the rights it contains
+ZOBRIST_CASTLING_RIGHTS = [0] * 16
+for castling_rights in range(16):
+    for right, bit in CASTLING_BITS.items():
+        if castling_rights & bit:
+            ZOBRIST_CASTLING_RIGHTS[castling_rights] ^= ZOBRIST_CASTLING[right]
+# rights that survive a move starting or ending on a square: moving the king or a rook,
+# or capturing a rook on its starting square, takes the matching rights away
+CASTLING_RIGHTS_MASK = [ALL_CASTLING_RIGHTS] * 64
+CASTLING_RIGHTS_MASK[0] = ALL_CASTLING_RIGHTS & ~BLACK_QUEENSIDE  # a8
+CASTLING_RIGHTS_MASK[4] = ALL_CASTLING_RIGHTS & ~(BLACK_KINGSIDE | BLACK_QUEENSIDE)  # e8
+CASTLING_RIGHTS_MASK[7] = ALL_CASTLING_RIGHTS & ~BLACK_KINGSIDE  # h8
+CASTLING_RIGHTS_MASK[56] = ALL_CASTLING_RIGHTS & ~WHITE_QUEENSIDE  # a1
+CASTLING_RIGHTS_MASK[60] = ALL_CASTLING_RIGHTS & ~(WHITE_KINGSIDE | WHITE_QUEENSIDE)  # e1
+CASTLING_RIGHTS_MASK[63] = ALL_CASTLING_RIGHTS & ~WHITE_KINGSIDE  # h1
+
+STARTING_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+CASTLING_LETTERS = (("K", WHITE_KINGSIDE), ("Q", WHITE_QUEENSIDE), ("k", BLACK_KINGSIDE), ("q", BLACK_QUEENSIDE))
+# the king and rook squares every right needs, a FEN right without them is dropped
+CASTLING_HOME_SQUARES = {WHITE_KINGSIDE: ((7, 4, "wK"), (7, 7, "wR")), WHITE_QUEENSIDE: ((7, 4, "wK"), (7, 0, "wR")),
+                         BLACK_KINGSIDE: ((0, 4, "bK"), (0, 7, "bR")), BLACK_QUEENSIDE: ((0, 4, "bK"), (0, 0, "bR"))}
+
+# number of undo records allocated up front; a game that runs longer grows the stack once per extra ply
+MAX_GAME_PLY = 1024
+
+# piece values and piece position tables used to score the board
+piece_score = {"K": 0, "Q": 9, "R": 5, "B": 3, "N": 3, "p": 1}
+
+knight_scores = [[0.0, 0.1, 0.2, 0.2, 0.2, 0.2, 0.1, 0.0],
+                 [0.1, 0.3, 0.5, 0.5, 0.5, 0.5, 0.3, 0.1],
+                 [0.2, 0.5, 0.6, 0.65, 0.65, 0.6, 0.5, 0.2],
+                 [0.2, 0.55, 0.65, 0.7, 0.7, 0.65, 0.55, 0.2],
+                 [0.2, 0.5, 0.65, 0.7, 0.7, 0.65, 0.5, 0.2],
+                 [0.2, 0.55, 0.6, 0.65, 0.65, 0.6, 0.55, 0.2],
+                 [0.1, 0.3, 0.5, 0.55, 0.55, 0.5, 0.3, 0.1],
+                 [0.0, 0.1, 0.2, 0.2, 0.2, 0.2, 0.1, 0.0]]
+
+bishop_scores = [[0.0, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 0.0],
+                 [0.2, 0.4, 0.4, 0.4, 0.4, 0.4, 0.4, 0.2],
+                 [0.2, 0.4, 0.5, 0.6, 0.6, 0.5, 0.4, 0.2],
+                 [0.2, 0.5, 0.5, 0.6, 0.6, 0.5, 0.5, 0.2],
+                 [0.2, 0.4, 0.6, 0.6, 0.6, 0.6, 0.4, 0.2],
+                 [0.2, 0.6, 0.6, 0.6, 0.6, 0.6, 0.6, 0.2],
+                 [0.2, 0.5, 0.4, 0.4, 0.4, 0.4, 0.5, 0.2],
+                 [0.0, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 0.0]]
+
+rook_scores = [[0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25],
+               [0.5, 0.75, 0.75, 0.75, 0.75, 0.75, 0.75, 0.5],
+               [0.0, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.0],
+               [0.0, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.0],
+               [0.0, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.0],
+               [0.0, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.0],
+               [0.0, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.0],
+               [0.25, 0.25, 0.25, 0.5, 0.5, 0.25, 0.25, 0.25]]
+
+queen_scores = [[0.0, 0.2, 0.2, 0.3, 0.3, 0.2, 0.2, 0.0],
+                [0.2, 0.4, 0.4, 0.4, 0.4, 0.4, 0.4, 0.2],
+                [0.2, 0.4, 0.5, 0.5, 0.5, 0.5, 0.4, 0.2],
+                [0.3, 0.4, 0.5, 0.5, 0.5, 0.5, 0.4, 0.3],
+                [0.4, 0.4, 0.5, 0.5, 0.5, 0.5, 0.4, 0.3],
+                [0.2, 0.5, 0.5, 0.5, 0.5, 0.5, 0.4, 0.2],
+                [0.2, 0.4, 0.5, 0.4, 0.4, 0.4, 0.4, 0.2],
+                [0.0, 0.2, 0.2, 0.3, 0.3, 0.2, 0.2, 0.0]]
+
+pawn_scores = [[0.8, 0.8, 0.8, 0.8, 0.8, 0.8, 0.8, 0.8],
+               [0.7, 0.7, 0.7, 0.7, 0.7, 0.7, 0.7, 0.7],
+               [0.3, 0.3, 0.4, 0.5, 0.5, 0.4, 0.3, 0.3],
+               [0.25, 0.25, 0.3, 0.45, 0.45, 0.3, 0.25, 0.25],
+               [0.2, 0.2, 0.2, 0.4, 0.4, 0.2, 0.2, 0.2],
+               [0.25, 0.15, 0.1, 0.2, 0.2, 0.1, 0.15, 0.25],
+               [0.25, 0.3, 0.3, 0.0, 0.0, 0.3, 0.3, 0.25],
+               [0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2]]
+
+piece_position_scores = {"wN": knight_scores,
+                         "bN": knight_scores[::-1],
+                         "wB": bishop_scores,
+                         "bB": bishop_scores[::-1],
+                         "wQ": queen_scores,
+                         "bQ": queen_scores[::-1],
+                         "wR": rook_scores,
+                         "bR": rook_scores[::-1],
+                         "wp": pawn_scores,
+                         "bp": pawn_scores[::-1]}
+
+# piece_score plus piece_position_scores flattened to one list per piece, indexed by square = row * 8 + col,
+# in centipawns so the running total in GameState stays exact; black pieces count negative
+PIECE_SQUARE_SCORES = {piece: [(1 if piece[0] == "w" else -1) * round(
+    (piece_score[piece[1]] + position_scores[row][col]) * 100) for row, col in SQUARE_COORDINATES]
+    for piece, position_scores in piece_position_scores.items()}
+PIECE_SQUARE_SCORES["wK"] = [0] * 64  # the king has no position table and no material value
+PIECE_SQUARE_SCORES["bK"] = [0] * 64
+
+
+
+def nearestSquare(direction_index, blockers):
+    """
+    Returns the square of the blocker closest to the origin of a ray in the given direction.
+    """
+    if POSITIVE_DIRECTIONS[direction_index]:
+        return (blockers & -blockers).bit_length() - 1
+    return blockers.bit_length() - 1
+
+
+def getSlidingAttacks(square, occupied, direction_indices):
+    """
+    Squares attacked from square along the given directions, stopping at (and including) the first blocker.
+    """
+    attacks = 0
+    for j in direction_indices:
+        ray = RAYS[j][square]
+        blockers = ray & occupied
+        if blockers:
+            if POSITIVE_DIRECTIONS[j]:
+                ray ^= RAYS[j][(blockers & -blockers).bit_length() - 1]
+            else:
+                ray ^= RAYS[j][blockers.bit_length() - 1]
+        attacks |= ray
+    return attacks
+
+
+def getRookAttacks(square, occupied):
+    return getSlidingAttacks(square, occupied, ORTHOGONAL_DIRECTIONS)
+
+
+def getBishopAttacks(square, occupied):
+    return getSlidingAttacks(square, occupied, DIAGONAL_DIRECTIONS)
+
+
+def getQueenAttacks(square, occupied):
+    return getSlidingAttacks(square, occupied, range(8))
 
 
 class GameState:
@@ -12,6 +230,8 @@ class GameState:
         The first character represents the color of the piece: 'b' or 'w'.
         The second character represents the type of the piece: 'R', 'N', 'B', 'Q', 'K' or 'p'.
         "--" represents an empty space with no piece.
+        The board is mirrored by bitboards, one 64-bit occupancy mask per piece and per color,
+        which the move generators use instead of walking the board square by square.
         """
         self.board = [
             ["bR", "bN", "bB", "bQ", "bK", "bB", "bN", "bR"],
@@ -33,62 +253,268 @@ class GameState:
         self.in_check = False
         self.pins = []
         self.checks = []
+        self.pinned = 0  # mask of the pieces in self.pins
+        self.pin_masks = {}  # square of a pinned piece -> mask of the line it may move along
+        self.king_danger = None  # squares the king to move can't step to, see getKingDangerSquares
         self.enpassant_possible = ()  # coordinates for the square where en-passant capture is possible
-        self.enpassant_possible_log = [self.enpassant_possible]
-        self.current_castling_rights = CastleRights(True, True, True, True)
-        self.castle_rights_log = [CastleRights(self.current_castling_rights.wks, self.current_castling_rights.bks,
-                                               self.current_castling_rights.wqs, self.current_castling_rights.bqs)]
+        self.castling_rights = ALL_CASTLING_RIGHTS  # WHITE_KINGSIDE | BLACK_KINGSIDE | ... bits
+        self.halfmove_clock = 0  # plies since the last capture or pawn move
+        self.fullmove_number = 1  # starts at 1, goes up after every black move
+        # what makeMove can't get back from the move itself, one record per ply of the move log,
+        # allocated once and overwritten in place
+        self.undo_stack = [UndoRecord() for ply in range(MAX_GAME_PLY)]
+        self.bitboards = {}  # piece -> mask of the squares it stands on
+        self.color_bitboards = {}  # 'w' / 'b' -> mask of all squares occupied by that color
+        self.zobrist_key = 0  # hash of the position, updated incrementally by makeMove and undoMove
+        self.score = 0  # material and piece position score in centipawns, positive is good for white
+        # getValidMoves result for one position: (position id, moves, moves by origin square,
+        # checkmate, stalemate, in_check, pins, checks), dropped by makeMove and undoMove
+        self.valid_moves_cache = None
+        self.loadBitboards()
+
+    def loadBitboards(self):
+        """
+        Rebuild all the bitboards from the board list.
+        """
+        self.bitboards = {color + piece_type: 0 for color in "wb" for piece_type in "pRNBQK"}
+        self.color_bitboards = {"w": 0, "b": 0}
+        for row in range(8):
+            for col in range(8):
+                piece = self.board[row][col]
+                if piece != "--":
+                    self.bitboards[piece] |= SQUARE_BITS[row * 8 + col]
+                    self.color_bitboards[piece[0]] |= SQUARE_BITS[row * 8 + col]
+        self.zobrist_key = self.computeZobristKey()
+        self.score = self.computeScore()
+        self.valid_moves_cache = None
+        self.king_danger = None
+
+    def computeZobristKey(self):
+        """
+        Hash the whole position from scratch.
+        """
+        key = 0
+        for piece, pieces in self.bitboards.items():
+            while pieces:
+                square = (pieces & -pieces).bit_length() - 1
+                pieces &= pieces - 1
+                key ^= ZOBRIST_PIECES[piece][square]
+        if not self.white_to_move:
+            key ^= ZOBRIST_BLACK_TO_MOVE
+        key ^= ZOBRIST_CASTLING_RIGHTS[self.castling_rights]
+        if self.enpassant_possible:
+            key ^= ZOBRIST_ENPASSANT[self.enpassant_possible[1]]
+        return key
+
+    def to_fen(self):
+        """
+        The position in Forsyth-Edwards Notation, e.g.
+        "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 1".
+        """
+        rows = []
+        for row in self.board:
+            fen_row = ""
+            empty = 0
+            for piece in row:
+                if piece == "--":
+                    empty += 1
+                else:
+                    if empty:
+                        fen_row += str(empty)
+                        empty = 0
+                    fen_row += PIECE_LETTERS[piece]
+            if empty:
+                fen_row += str(empty)
+            rows.append(fen_row)
+        castling = "".join(letter for letter, bit in CASTLING_LETTERS if self.castling_rights & bit) or "-"
+        if self.enpassant_possible:
+            enpassant = Move.cols_to_files[self.enpassant_possible[1]] + Move.rows_to_ranks[self.enpassant_possible[0]]
+        else:
+            enpassant = "-"
+        return " ".join(("/".join(rows), "w" if self.white_to_move else "b", castling, enpassant,
+                         str(self.halfmove_clock), str(self.fullmove_number)))
+
+    @classmethod
+    def from_fen(cls, fen):
+        """
+        Build a GameState from a FEN string. The move counters may be left out.
+        The move log starts out empty. Raises ValueError if the FEN can't be read.
+        Castling rights whose king and rook aren't on their home squares, and an en-passant square
+        no pawn can just have skipped, are dropped.
+        """
+        fields = fen.split()
+        if not 4 <= len(fields) <= 6:
+            raise ValueError("FEN needs 4 to 6 fields: " + repr(fen))
+        fen_rows = fields[0].split("/")
+        if len(fen_rows) != 8:
+            raise ValueError("FEN board needs 8 rows: " + repr(fen))
+        board = []
+        for fen_row in fen_rows:
+            row = []
+            for letter in fen_row:
+                if letter in "12345678":
+                    row.extend(["--"] * int(letter))
+                elif letter in LETTER_PIECES:
+                    row.append(LETTER_PIECES[letter])
+                else:
+                    raise ValueError("unknown piece {!r} in FEN: {!r}".format(letter, fen))
+            if len(row) != 8:
+                raise ValueError("FEN row {!r} is not 8 squares long".format(fen_row))
+            board.append(row)
+        if fields[1] not in ("w", "b"):
+            raise ValueError("FEN side to move must be w or b: " + repr(fen))
+        castling_rights = 0
+        if fields[2] != "-":
+            for letter in fields[2]:
+                bits = [bit for castling_letter, bit in CASTLING_LETTERS if castling_letter == letter]
+                if not bits:
+                    raise ValueError("unknown castling right {!r} in FEN: {!r}".format(letter, fen))
+                if all(board[row][col] == piece for row, col, piece in CASTLING_HOME_SQUARES[bits[0]]):
+                    castling_rights |= bits[0]
+        enpassant_possible = ()
+        if fields[3] != "-":
+            if len(fields[3]) != 2 or fields[3][0] not in Move.files_to_cols or fields[3][1] not in "36":
+                raise ValueError("bad en-passant square in FEN: " + repr(fen))
+            row, col = Move.ranks_to_rows[fields[3][1]], Move.files_to_cols[fields[3][0]]
+            # the enemy pawn that just moved two squares stands behind the square, which it skipped,
+            # and its start square in front is empty again
+            direction, enemy_pawn = (1, "bp") if fields[1] == "w" else (-1, "wp")
+            if (fields[3][1] == ("6" if fields[1] == "w" else "3") and board[row + direction][col] == enemy_pawn
+                    and board[row][col] == "--" and board[row - direction][col] == "--"):
+                enpassant_possible = (row, col)
+
+        game_state = cls()
+        game_state.board = board
+        game_state.white_to_move = fields[1] == "w"
+        game_state.castling_rights = castling_rights
+        game_state.enpassant_possible = enpassant_possible
+        try:
+            game_state.halfmove_clock = int(fields[4]) if len(fields) > 4 else 0
+            game_state.fullmove_number = int(fields[5]) if len(fields) > 5 else 1
+        except ValueError:
+            raise ValueError("bad move counters in FEN: " + repr(fen)) from None
+        kings = {"wK": [], "bK": []}
+        for row in range(8):
+            for col in range(8):
+                if board[row][col] in kings:
+                    kings[board[row][col]].append((row, col))
+        if len(kings["wK"]) != 1 or len(kings["bK"]) != 1:
+            raise ValueError("FEN needs exactly one king of each color: " + repr(fen))
+        game_state.white_king_location = kings["wK"][0]
+        game_state.black_king_location = kings["bK"][0]
+        game_state.loadBitboards()
+        return game_state
+
+    def copy(self):
+        """
+        Independent copy of the position, e.g. for the AI to search in another thread
+        while the original is being read. The move log is not copied.
+        """
+        return GameState.from_fen(self.to_fen())
+
+    def computeScore(self):
+        """
+        Sum the material and piece position score of every piece from scratch.
+        """
+        score = 0
+        for piece, pieces in self.bitboards.items():
+            while pieces:
+                square = (pieces & -pieces).bit_length() - 1
+                pieces &= pieces - 1
+                score += PIECE_SQUARE_SCORES[piece][square]
+        return score
+
+    def placePiece(self, row, col, piece):
+        """
+        Put piece on an empty square, keeping the board and the bitboards in sync.
+        """
+        bit = SQUARE_BITS[row * 8 + col]
+        self.board[row][col] = piece
+        self.bitboards[piece] |= bit
+        self.color_bitboards[piece[0]] |= bit
+        self.zobrist_key ^= ZOBRIST_PIECES[piece][row * 8 + col]
+        self.score += PIECE_SQUARE_SCORES[piece][row * 8 + col]
+
+    def clearSquare(self, row, col):
+        """
+        Remove whatever piece stands on the square, keeping the board and the bitboards in sync.
+        """
+        piece = self.board[row][col]
+        if piece != "--":
+            bit = SQUARE_BITS[row * 8 + col]
+            self.board[row][col] = "--"
+            self.bitboards[piece] ^= bit
+            self.color_bitboards[piece[0]] ^= bit
+            self.zobrist_key ^= ZOBRIST_PIECES[piece][row * 8 + col]
+            self.score -= PIECE_SQUARE_SCORES[piece][row * 8 + col]
 
     def makeMove(self, move):
         """
         Takes a Move as a parameter and executes it.
         (this will not work for castling, pawn promotion and en-passant)
         """
-        self.board[move.start_row][move.start_col] = "--"
-        self.board[move.end_row][move.end_col] = move.piece_moved
+        self.valid_moves_cache = None
+        self.king_danger = None
+        ply = len(self.move_log)
+        if ply == len(self.undo_stack):
+            self.undo_stack.append(UndoRecord())
+        record = self.undo_stack[ply]
+        record.piece_captured = move.piece_captured
+        record.castling_rights = self.castling_rights
+        record.enpassant_possible = self.enpassant_possible
+        record.zobrist_key = self.zobrist_key
+        record.halfmove_clock = self.halfmove_clock
+        if move.piece_moved[1] == "p" or move.piece_captured != "--":
+            self.halfmove_clock = 0
+        else:
+            self.halfmove_clock += 1
+        if not self.white_to_move:
+            self.fullmove_number += 1
+
+        self.clearSquare(move.start_row, move.start_col)
+        self.clearSquare(move.end_row, move.end_col)
+        # pawn promotion
+        if move.is_pawn_promotion:
+            self.placePiece(move.end_row, move.end_col, move.piece_moved[0] + move.promotion_piece)
+        else:
+            self.placePiece(move.end_row, move.end_col, move.piece_moved)
         self.move_log.append(move)  # log the move so we can undo it later
         self.white_to_move = not self.white_to_move  # switch players
+        self.zobrist_key ^= ZOBRIST_BLACK_TO_MOVE
         # update king's location if moved
         if move.piece_moved == "wK":
             self.white_king_location = (move.end_row, move.end_col)
         elif move.piece_moved == "bK":
             self.black_king_location = (move.end_row, move.end_col)
 
-        # pawn promotion
-        if move.is_pawn_promotion:
-            # if not is_AI:
-            #    promoted_piece = input("Promote to Q, R, B, or N:") #take this to UI later
-            #    self.board[move.end_row][move.end_col] = move.piece_moved[0] + promoted_piece
-            # else:
-            self.board[move.end_row][move.end_col] = move.piece_moved[0] + "Q"
-
         # enpassant move
         if move.is_enpassant_move:
-            self.board[move.start_row][move.end_col] = "--"  # capturing the pawn
+            self.clearSquare(move.start_row, move.end_col)  # capturing the pawn
 
         # update enpassant_possible variable
+        if self.enpassant_possible:
+            self.zobrist_key ^= ZOBRIST_ENPASSANT[self.enpassant_possible[1]]
         if move.piece_moved[1] == "p" and abs(move.start_row - move.end_row) == 2:  # only on 2 square pawn advance
-            self.enpassant_possible = ((move.start_row + move.end_row) // 2, move.start_col)
+            self.enpassant_possible = SQUARE_COORDINATES[(move.start_row + move.end_row) // 2 * 8 + move.start_col]
+            self.zobrist_key ^= ZOBRIST_ENPASSANT[move.start_col]
         else:
             self.enpassant_possible = ()
 
         # castle move
         if move.is_castle_move:
             if move.end_col - move.start_col == 2:  # king-side castle move
-                self.board[move.end_row][move.end_col - 1] = self.board[move.end_row][
-                    move.end_col + 1]  # moves the rook to its new square
-                self.board[move.end_row][move.end_col + 1] = '--'  # erase old rook
+                rook = self.board[move.end_row][move.end_col + 1]
+                self.clearSquare(move.end_row, move.end_col + 1)  # erase old rook
+                self.placePiece(move.end_row, move.end_col - 1, rook)  # moves the rook to its new square
             else:  # queen-side castle move
-                self.board[move.end_row][move.end_col + 1] = self.board[move.end_row][
-                    move.end_col - 2]  # moves the rook to its new square
-                self.board[move.end_row][move.end_col - 2] = '--'  # erase old rook
-
-        self.enpassant_possible_log.append(self.enpassant_possible)
+                rook = self.board[move.end_row][move.end_col - 2]
+                self.clearSquare(move.end_row, move.end_col - 2)  # erase old rook
+                self.placePiece(move.end_row, move.end_col + 1, rook)  # moves the rook to its new square
 
         # update castling rights - whenever it is a rook or king move
+        self.zobrist_key ^= ZOBRIST_CASTLING_RIGHTS[self.castling_rights]
         self.updateCastleRights(move)
-        self.castle_rights_log.append(CastleRights(self.current_castling_rights.wks, self.current_castling_rights.bks,
-                                                   self.current_castling_rights.wqs, self.current_castling_rights.bqs))
+        self.zobrist_key ^= ZOBRIST_CASTLING_RIGHTS[self.castling_rights]
 
     def undoMove(self):
         """
@@ -96,34 +522,41 @@ class GameState:
         """
         if len(self.move_log) != 0:  # make sure that there is a move to undo
             move = self.move_log.pop()
-            self.board[move.start_row][move.start_col] = move.piece_moved
-            self.board[move.end_row][move.end_col] = move.piece_captured
+            record = self.undo_stack[len(self.move_log)]
+            self.valid_moves_cache = None
+            self.king_danger = None
+            self.clearSquare(move.end_row, move.end_col)
+            self.placePiece(move.start_row, move.start_col, move.piece_moved)
+            # undo en passant move
+            if move.is_enpassant_move:
+                # leave landing square blank
+                self.placePiece(move.start_row, move.end_col, record.piece_captured)
+            elif record.piece_captured != "--":
+                self.placePiece(move.end_row, move.end_col, record.piece_captured)
             self.white_to_move = not self.white_to_move  # swap players
             # update the king's position if needed
             if move.piece_moved == "wK":
                 self.white_king_location = (move.start_row, move.start_col)
             elif move.piece_moved == "bK":
                 self.black_king_location = (move.start_row, move.start_col)
-            # undo en passant move
-            if move.is_enpassant_move:
-                self.board[move.end_row][move.end_col] = "--"  # leave landing square blank
-                self.board[move.start_row][move.end_col] = move.piece_captured
 
-            self.enpassant_possible_log.pop()
-            self.enpassant_possible = self.enpassant_possible_log[-1]
-
-            # undo castle rights
-            self.castle_rights_log.pop()  # get rid of the new castle rights from the move we are undoing
-            self.current_castling_rights = self.castle_rights_log[
-                -1]  # set the current castle rights to the last one in the list
+            # en-passant square and castle rights from before the move
+            self.enpassant_possible = record.enpassant_possible
+            self.castling_rights = record.castling_rights
+            self.halfmove_clock = record.halfmove_clock
+            if not self.white_to_move:
+                self.fullmove_number -= 1
             # undo the castle move
             if move.is_castle_move:
                 if move.end_col - move.start_col == 2:  # king-side
-                    self.board[move.end_row][move.end_col + 1] = self.board[move.end_row][move.end_col - 1]
-                    self.board[move.end_row][move.end_col - 1] = '--'
+                    rook = self.board[move.end_row][move.end_col - 1]
+                    self.clearSquare(move.end_row, move.end_col - 1)
+                    self.placePiece(move.end_row, move.end_col + 1, rook)
                 else:  # queen-side
-                    self.board[move.end_row][move.end_col - 2] = self.board[move.end_row][move.end_col + 1]
-                    self.board[move.end_row][move.end_col + 1] = '--'
+                    rook = self.board[move.end_row][move.end_col + 1]
+                    self.clearSquare(move.end_row, move.end_col + 1)
+                    self.placePiece(move.end_row, move.end_col - 2, rook)
+            self.zobrist_key = record.zobrist_key
             self.checkmate = False
             self.stalemate = False
 
@@ -131,45 +564,24 @@ class GameState:
         """
         Update the castle rights given the move
         """
-        if move.piece_captured == "wR":
-            if move.end_col == 0:  # left rook
-                self.current_castling_rights.wqs = False
-            elif move.end_col == 7:  # right rook
-                self.current_castling_rights.wks = False
-        elif move.piece_captured == "bR":
-            if move.end_col == 0:  # left rook
-                self.current_castling_rights.bqs = False
-            elif move.end_col == 7:  # right rook
-                self.current_castling_rights.bks = False
-
-        if move.piece_moved == 'wK':
-            self.current_castling_rights.wqs = False
-            self.current_castling_rights.wks = False
-        elif move.piece_moved == 'bK':
-            self.current_castling_rights.bqs = False
-            self.current_castling_rights.bks = False
-        elif move.piece_moved == 'wR':
-            if move.start_row == 7:
-                if move.start_col == 0:  # left rook
-                    self.current_castling_rights.wqs = False
-                elif move.start_col == 7:  # right rook
-                    self.current_castling_rights.wks = False
-        elif move.piece_moved == 'bR':
-            if move.start_row == 0:
-                if move.start_col == 0:  # left rook
-                    self.current_castling_rights.bqs = False
-                elif move.start_col == 7:  # right rook
-                    self.current_castling_rights.bks = False
+        self.castling_rights &= (CASTLING_RIGHTS_MASK[move.start_row * 8 + move.start_col]
+                                 & CASTLING_RIGHTS_MASK[move.end_row * 8 + move.end_col])
 
     def getValidMoves(self):
         """
         All moves considering checks.
+        Asking again for the same position returns a copy of the cached list, and restores
+        the checkmate, stalemate, in_check, pins and checks that generating it had set.
         """
-        temp_castle_rights = CastleRights(self.current_castling_rights.wks, self.current_castling_rights.bks,
-                                          self.current_castling_rights.wqs, self.current_castling_rights.bqs)
+        position_id = (len(self.move_log), self.zobrist_key)
+        cache = self.valid_moves_cache
+        if cache is not None and cache[0] == position_id:
+            self.checkmate, self.stalemate, self.in_check, self.pins, self.checks = cache[3:]
+            self.setPinMasks()
+            return list(cache[1])
         # advanced algorithm
         moves = []
-        self.in_check, self.pins, self.checks = self.checkForPinsAndChecks()
+        self.updatePinsAndChecks()
 
         if self.white_to_move:
             king_row = self.white_king_location[0]
@@ -178,33 +590,7 @@ class GameState:
             king_row = self.black_king_location[0]
             king_col = self.black_king_location[1]
         if self.in_check:
-            if len(self.checks) == 1:  # only 1 check, block the check or move the king
-                moves = self.getAllPossibleMoves()
-                # to block the check you must put a piece into one of the squares between the enemy piece and your king
-                check = self.checks[0]  # check information
-                check_row = check[0]
-                check_col = check[1]
-                piece_checking = self.board[check_row][check_col]
-                valid_squares = []  # squares that pieces can move to
-                # if knight, must capture the knight or move your king, other pieces can be blocked
-                if piece_checking[1] == "N":
-                    valid_squares = [(check_row, check_col)]
-                else:
-                    for i in range(1, 8):
-                        valid_square = (king_row + check[2] * i,
-                                        king_col + check[3] * i)  # check[2] and check[3] are the check directions
-                        valid_squares.append(valid_square)
-                        if valid_square[0] == check_row and valid_square[
-                            1] == check_col:  # once you get to piece and check
-                            break
-                # get rid of any moves that don't block check or move king
-                for i in range(len(moves) - 1, -1, -1):  # iterate through the list backwards when removing elements
-                    if moves[i].piece_moved[1] != "K":  # move doesn't move king so it must block or capture
-                        if not (moves[i].end_row,
-                                moves[i].end_col) in valid_squares:  # move doesn't block or capture piece
-                            moves.remove(moves[i])
-            else:  # double check, king has to move
-                self.getKingMoves(king_row, king_col, moves)
+            moves = self.getCheckEvasions(king_row, king_col)
         else:  # not in check - all moves are fine
             moves = self.getAllPossibleMoves()
             if self.white_to_move:
@@ -222,9 +608,72 @@ class GameState:
             self.checkmate = False
             self.stalemate = False
 
-        self.current_castling_rights = temp_castle_rights
+        self.valid_moves_cache = (position_id, tuple(moves), None, self.checkmate, self.stalemate, self.in_check,
+                                  self.pins, self.checks)
+        return moves
+
+    def getValidMovesByOrigin(self):
+        """
+        The valid moves of the current position grouped by start square: {(row, col): [moves]}.
+        Built once per position, so looking up the moves of one piece is a dictionary lookup.
+        """
+        cache = self.valid_moves_cache
+        if cache is None or cache[0] != (len(self.move_log), self.zobrist_key):
+            self.getValidMoves()
+            cache = self.valid_moves_cache
+        if cache[2] is None:
+            moves_by_origin = {}
+            for move in cache[1]:
+                moves_by_origin.setdefault((move.start_row, move.start_col), []).append(move)
+            cache = cache[:2] + (moves_by_origin,) + cache[3:]
+            self.valid_moves_cache = cache
+        return cache[2]
+
+    def getCheckEvasions(self, king_row, king_col):
+        """
+        Legal moves when in check: king moves, and in single check also the moves of the other pieces
+        that capture the checking piece or block it. Expects updatePinsAndChecks to have just run.
+        """
+        moves = []
+        if len(self.checks) == 1:  # only 1 check, block the check or move the king
+            block_mask = self.getCheckBlockMask(king_row * 8 + king_col, self.checks[0])
+            turn = "w" if self.white_to_move else "b"
+            self.getAllPawnMoves(moves, block_mask, quiet_promotions=False)
+            for piece_type, move_function in self.moveFunctions.items():
+                if piece_type == "p" or piece_type == "K":
+                    continue
+                pieces = self.bitboards[turn + piece_type]
+                while pieces:
+                    square = (pieces & -pieces).bit_length() - 1
+                    pieces &= pieces - 1
+                    move_function(square // 8, square % 8, moves, block_mask)
+        # in double check only the king can move
+        self.getKingMoves(king_row, king_col, moves)
         return moves
 
+    @staticmethod
+    def getCheckBlockMask(king_square, check):
+        """
+        Squares a piece other than the king can move to to answer the check: the checking piece itself,
+        and for a slider every square between it and the king.
+        """
+        check_square = check[0] * 8 + check[1]
+        j = DIRECTION_INDEX.get((check[2], check[3]))
+        if j is None:  # knight, the offset of a knight check is not a direction
+            return SQUARE_BITS[check_square]
+        # the ray from the king up to and including the checker, for a contact check just the checker
+        return RAYS[j][king_square] ^ RAYS[j][check_square]
+
+    def getCaptureMoves(self):
+        """
+        Legal captures and pawn promotions only, for searching capture sequences to the end.
+        In check every legal move is returned instead, since the check has to be answered first.
+        """
+        self.updatePinsAndChecks()
+        if self.in_check:
+            return self.getValidMoves()
+        return self.getAllPossibleMoves(self.color_bitboards["b" if self.white_to_move else "w"])
+
     def inCheck(self):
         """
         Determine if a current player is in check
@@ -238,31 +687,94 @@ class GameState:
         """
         Determine if enemy can attack the square row col
         """
-        self.white_to_move = not self.white_to_move  # switch to opponent's point of view
-        opponents_moves = self.getAllPossibleMoves()
-        self.white_to_move = not self.white_to_move
-        for move in opponents_moves:
-            if move.end_row == row and move.end_col == col:  # square is under attack
-                return True
-        return False
+        return self.isSquareAttacked(row * 8 + col, "b" if self.white_to_move else "w")
+
+    def isSquareAttacked(self, square, attacker_color, occupied=None):
+        """
+        Determine if any piece of attacker_color attacks the square.
+        Looks outward from the square itself: a knight, pawn or king attacks it if the same piece
+        standing on the square would attack them back, and sliders are found by ray scans.
+        """
+        bitboards = self.bitboards
+        if KNIGHT_ATTACKS[square] & bitboards[attacker_color + "N"]:
+            return True
+        defender_color = "w" if attacker_color == "b" else "b"
+        if PAWN_ATTACKS[defender_color][square] & bitboards[attacker_color + "p"]:
+            return True
+        if KING_ATTACKS[square] & bitboards[attacker_color + "K"]:
+            return True
+        if occupied is None:
+            occupied = self.color_bitboards["w"] | self.color_bitboards["b"]
+        queens = bitboards[attacker_color + "Q"]
+        rooks = bitboards[attacker_color + "R"] | queens
+        if rooks and getRookAttacks(square, occupied) & rooks:
+            return True
+        bishops = bitboards[attacker_color + "B"] | queens
+        return bishops != 0 and getBishopAttacks(square, occupied) & bishops != 0
 
-    def getAllPossibleMoves(self):
+    def getAttackedSquares(self, attacker_color, occupied=None):
+        """
+        Mask of every square attacked by attacker_color, whether it is empty or occupied by either side.
+        """
+        bitboards = self.bitboards
+        if occupied is None:
+            occupied = self.color_bitboards["w"] | self.color_bitboards["b"]
+        pawns = bitboards[attacker_color + "p"]
+        if attacker_color == "w":
+            attacked = ((pawns & ~FILE_BITS[0]) >> 9) | ((pawns & ~FILE_BITS[7]) >> 7)
+        else:
+            attacked = ((pawns & ~FILE_BITS[0]) << 7) | ((pawns & ~FILE_BITS[7]) << 9)
+        king = bitboards[attacker_color + "K"]
+        if king:
+            attacked |= KING_ATTACKS[king.bit_length() - 1]
+        for piece_type, attack_function in (("N", None), ("R", getRookAttacks), ("B", getBishopAttacks),
+                                            ("Q", getQueenAttacks)):
+            pieces = bitboards[attacker_color + piece_type]
+            while pieces:
+                square = (pieces & -pieces).bit_length() - 1
+                pieces &= pieces - 1
+                if attack_function is None:
+                    attacked |= KNIGHT_ATTACKS[square]
+                else:
+                    attacked |= attack_function(square, occupied)
+        return attacked & ALL_SQUARES
+
+    def getKingDangerSquares(self):
+        """
+        Mask of the squares the king to move must not step to: every square the enemy attacks,
+        with our king taken off the board so it can't hide from a slider behind itself.
+        Computed once per position, king moves and castling are filtered against it.
+        """
+        if self.king_danger is None:
+            if self.white_to_move:
+                ally_color, enemy_color = "w", "b"
+            else:
+                ally_color, enemy_color = "b", "w"
+            occupied = (self.color_bitboards["w"] | self.color_bitboards["b"]) & ~self.bitboards[ally_color + "K"]
+            self.king_danger = self.getAttackedSquares(enemy_color, occupied)
+        return self.king_danger
+
+    def getAllPossibleMoves(self, targets=ALL_SQUARES):
         """
         All moves without considering checks.
+        Only moves landing on a square in the targets mask are generated, pawn promotions always are.
         """
         moves = []
-        for row in range(len(self.board)):
-            for col in range(len(self.board[row])):
-                turn = self.board[row][col][0]
-                if (turn == "w" and self.white_to_move) or (turn == "b" and not self.white_to_move):
-                    piece = self.board[row][col][1]
-                    self.moveFunctions[piece](row, col, moves)  # calls appropriate move function based on piece type
+        turn = "w" if self.white_to_move else "b"
+        self.getAllPawnMoves(moves, targets)
+        for piece_type, move_function in self.moveFunctions.items():
+            if piece_type == "p":
+                continue
+            pieces = self.bitboards[turn + piece_type]
+            while pieces:
+                square = (pieces & -pieces).bit_length() - 1
+                pieces &= pieces - 1
+                move_function(square // 8, square % 8, moves, targets)  # calls move function based on piece type
         return moves
 
     def checkForPinsAndChecks(self):
         pins = []  # squares pinned and the direction its pinned from
         checks = []  # squares where enemy is applying a check
-        in_check = False
         if self.white_to_move:
             enemy_color = "b"
             ally_color = "w"
@@ -273,293 +785,300 @@ class GameState:
             ally_color = "b"
             start_row = self.black_king_location[0]
             start_col = self.black_king_location[1]
+        king_square = start_row * 8 + start_col
+        ally_pieces = self.color_bitboards[ally_color] & ~self.bitboards[ally_color + "K"]
+        occupied = ally_pieces | self.color_bitboards[enemy_color]
+        enemy_queens = self.bitboards[enemy_color + "Q"]
+        enemy_sliders = (self.bitboards[enemy_color + "R"] | enemy_queens,
+                         self.bitboards[enemy_color + "B"] | enemy_queens)
         # check outwards from king for pins and checks, keep track of pins
-        directions = ((-1, 0), (0, -1), (1, 0), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1))
-        for j in range(len(directions)):
-            direction = directions[j]
-            possible_pin = ()  # reset possible pins
-            for i in range(1, 8):
-                end_row = start_row + direction[0] * i
-                end_col = start_col + direction[1] * i
-                if 0 <= end_row <= 7 and 0 <= end_col <= 7:
-                    end_piece = self.board[end_row][end_col]
-                    if end_piece[0] == ally_color and end_piece[1] != "K":
-                        if possible_pin == ():  # first allied piece could be pinned
-                            possible_pin = (end_row, end_col, direction[0], direction[1])
-                        else:  # 2nd allied piece - no check or pin from this direction
-                            break
-                    elif end_piece[0] == enemy_color:
-                        enemy_type = end_piece[1]
-                        # 5 possibilities in this complex conditional
-                        # 1.) orthogonally away from king and piece is a rook
-                        # 2.) diagonally away from king and piece is a bishop
-                        # 3.) 1 square away diagonally from king and piece is a pawn
-                        # 4.) any direction and piece is a queen
-                        # 5.) any direction 1 square away and piece is a king
-                        if (0 <= j <= 3 and enemy_type == "R") or (4 <= j <= 7 and enemy_type == "B") or (
-                                i == 1 and enemy_type == "p" and (
-                                (enemy_color == "w" and 6 <= j <= 7) or (enemy_color == "b" and 4 <= j <= 5))) or (
-                                enemy_type == "Q") or (i == 1 and enemy_type == "K"):
-                            if possible_pin == ():  # no piece blocking, so check
-                                in_check = True
-                                checks.append((end_row, end_col, direction[0], direction[1]))
-                                break
-                            else:  # piece blocking so pin
-                                pins.append(possible_pin)
-                                break
-                        else:  # enemy piece not applying checks
-                            break
-                else:
-                    break  # off board
-        # check for knight checks
-        knight_moves = ((-2, -1), (-2, 1), (-1, 2), (1, 2), (2, -1), (2, 1), (-1, -2), (1, -2))
-        for move in knight_moves:
-            end_row = start_row + move[0]
-            end_col = start_col + move[1]
-            if 0 <= end_row <= 7 and 0 <= end_col <= 7:
-                end_piece = self.board[end_row][end_col]
-                if end_piece[0] == enemy_color and end_piece[1] == "N":  # enemy knight attacking a king
-                    in_check = True
-                    checks.append((end_row, end_col, move[0], move[1]))
-        return in_check, pins, checks
+        for j in range(8):
+            ray = RAYS[j][king_square]
+            blockers = ray & occupied
+            if not blockers:
+                continue
+            direction = DIRECTIONS[j]
+            sliders = enemy_sliders[0] if j <= 3 else enemy_sliders[1]
+            first = nearestSquare(j, blockers)
+            if SQUARE_BITS[first] & ally_pieces:  # first allied piece could be pinned
+                blockers ^= SQUARE_BITS[first]
+                if blockers:
+                    second = nearestSquare(j, blockers)
+                    if SQUARE_BITS[second] & sliders:  # piece blocking so pin
+                        pins.append((first // 8, first % 8, direction[0], direction[1]))
+            elif SQUARE_BITS[first] & sliders:  # no piece blocking, so check
+                checks.append((first // 8, first % 8, direction[0], direction[1]))
+        # check for knight, pawn and king checks, their direction is the offset from the king
+        contact_checks = (KNIGHT_ATTACKS[king_square] & self.bitboards[enemy_color + "N"]) | (
+                PAWN_ATTACKS[ally_color][king_square] & self.bitboards[enemy_color + "p"]) | (
+                                 KING_ATTACKS[king_square] & self.bitboards[enemy_color + "K"])
+        while contact_checks:
+            square = (contact_checks & -contact_checks).bit_length() - 1
+            contact_checks &= contact_checks - 1
+            end_row, end_col = SQUARE_COORDINATES[square]
+            checks.append((end_row, end_col, end_row - start_row, end_col - start_col))
+        return len(checks) > 0, pins, checks
 
-    def getPawnMoves(self, row, col, moves):
+    def updatePinsAndChecks(self):
         """
-        Get all the pawn moves for the pawn located at row, col and add the moves to the list.
+        Find the checks and pins of the side to move and get the pin masks ready for the move generators.
         """
-        piece_pinned = False
-        pin_direction = ()
-        for i in range(len(self.pins) - 1, -1, -1):
-            if self.pins[i][0] == row and self.pins[i][1] == col:
-                piece_pinned = True
-                pin_direction = (self.pins[i][2], self.pins[i][3])
-                self.pins.remove(self.pins[i])
-                break
+        self.in_check, self.pins, self.checks = self.checkForPinsAndChecks()
+        self.setPinMasks()
 
+    def setPinMasks(self):
+        """
+        Turn self.pins into self.pinned and self.pin_masks, so a piece's pin is a mask lookup.
+        """
+        self.pinned = 0
+        self.pin_masks = {}
+        if not self.pins:
+            return
+        if self.white_to_move:
+            king_square = self.white_king_location[0] * 8 + self.white_king_location[1]
+        else:
+            king_square = self.black_king_location[0] * 8 + self.black_king_location[1]
+        for pin in self.pins:
+            square = pin[0] * 8 + pin[1]
+            j = DIRECTION_INDEX[(pin[2], pin[3])]
+            self.pinned |= SQUARE_BITS[square]
+            self.pin_masks[square] = RAYS[j][king_square] | RAYS[OPPOSITE_DIRECTION[j]][king_square]
+
+    def getPinMask(self, row, col):
+        """
+        Squares the piece at row, col may move to without leaving its pin line (all squares when not pinned).
+        """
+        square = row * 8 + col
+        if self.pinned & SQUARE_BITS[square]:
+            return self.pin_masks[square]
+        return ALL_SQUARES
+
+    def addMoves(self, row, col, targets, moves):
+        """
+        Add a move from row, col to every square in the targets mask.
+        """
+        while targets:
+            square = (targets & -targets).bit_length() - 1
+            targets &= targets - 1
+            moves.append(Move((row, col), SQUARE_COORDINATES[square], self.board))
+
+    def getAllPawnMoves(self, moves, targets=ALL_SQUARES, quiet_promotions=True):
+        """
+        Get the moves of all our pawns at once by shifting the whole pawn bitboard.
+        Pinned pawns and en-passant captures go through getPawnMoves one pawn at a time.
+        Pushes onto the last rank are generated even outside targets unless quiet_promotions is False.
+        """
+        if self.white_to_move:
+            ally_color, enemy_color = "w", "b"
+        else:
+            ally_color, enemy_color = "b", "w"
+        pawns = self.bitboards[ally_color + "p"]
+        pinned_pawns = pawns & self.pinned
+        pawns ^= pinned_pawns
+        while pinned_pawns:
+            square = (pinned_pawns & -pinned_pawns).bit_length() - 1
+            pinned_pawns &= pinned_pawns - 1
+            self.getPawnMoves(square // 8, square % 8, moves, targets, quiet_promotions)
+        if self.enpassant_possible:
+            enpassant_square = self.enpassant_possible[0] * 8 + self.enpassant_possible[1]
+            enpassant_pawns = PAWN_ATTACKS[enemy_color][enpassant_square] & pawns
+            pawns ^= enpassant_pawns
+            while enpassant_pawns:
+                square = (enpassant_pawns & -enpassant_pawns).bit_length() - 1
+                enpassant_pawns &= enpassant_pawns - 1
+                self.getPawnMoves(square // 8, square % 8, moves, targets, quiet_promotions)
+        empty = ~(self.color_bitboards["w"] | self.color_bitboards["b"]) & ALL_SQUARES
+        enemies = self.color_bitboards[enemy_color] & targets
+        push_targets = targets | PROMOTION_SQUARES if quiet_promotions else targets
+        if self.white_to_move:
+            one_step = (pawns >> 8) & empty
+            two_steps = ((one_step & RANK_BITS[5]) >> 8) & empty & targets
+            one_step &= push_targets
+            left_captures = ((pawns & ~FILE_BITS[0]) >> 9) & enemies
+            right_captures = ((pawns & ~FILE_BITS[7]) >> 7) & enemies
+            shifts = ((one_step, -8), (two_steps, -16), (left_captures, -9), (right_captures, -7))
+        else:
+            one_step = (pawns << 8) & empty
+            two_steps = ((one_step & RANK_BITS[2]) << 8) & empty & targets
+            one_step &= push_targets
+            left_captures = ((pawns & ~FILE_BITS[0]) << 7) & enemies
+            right_captures = ((pawns & ~FILE_BITS[7]) << 9) & enemies
+            shifts = ((one_step, 8), (two_steps, 16), (left_captures, 7), (right_captures, 9))
+        board = self.board
+        for targets, shift in shifts:
+            promotions = targets & PROMOTION_SQUARES
+            targets ^= promotions
+            while targets:
+                square = (targets & -targets).bit_length() - 1
+                targets &= targets - 1
+                moves.append(Move(SQUARE_COORDINATES[square - shift], SQUARE_COORDINATES[square], board))
+            while promotions:
+                square = (promotions & -promotions).bit_length() - 1
+                promotions &= promotions - 1
+                self.addPromotionMoves(SQUARE_COORDINATES[square - shift], SQUARE_COORDINATES[square], moves)
+
+    def addPromotionMoves(self, start_square, end_square, moves):
+        """
+        Add one move per piece the pawn can promote to, the queen first.
+        """
+        for promotion_piece in "QRBN":
+            moves.append(Move(start_square, end_square, self.board, promotion_piece=promotion_piece))
+
+    def getPawnMoves(self, row, col, moves, targets=ALL_SQUARES, quiet_promotions=True):
+        """
+        Get all the pawn moves for the pawn located at row, col and add the moves to the list.
+        An en-passant capture counts as landing in targets if either its landing square
+        or the square of the pawn it takes is in there.
+        """
+        allowed = self.getPinMask(row, col)
+        push_allowed = allowed & (targets | PROMOTION_SQUARES if quiet_promotions else targets)
         if self.white_to_move:
             move_amount = -1
             start_row = 6
-            enemy_color = "b"
-            king_row, king_col = self.white_king_location
+            ally_color, enemy_color = "w", "b"
         else:
             move_amount = 1
             start_row = 1
-            enemy_color = "w"
-            king_row, king_col = self.black_king_location
-
-        if self.board[row + move_amount][col] == "--":  # 1 square pawn advance
-            if not piece_pinned or pin_direction == (move_amount, 0):
-                moves.append(Move((row, col), (row + move_amount, col), self.board))
-                if row == start_row and self.board[row + 2 * move_amount][col] == "--":  # 2 square pawn advance
-                    moves.append(Move((row, col), (row + 2 * move_amount, col), self.board))
-        if col - 1 >= 0:  # capture to the left
-            if not piece_pinned or pin_direction == (move_amount, -1):
-                if self.board[row + move_amount][col - 1][0] == enemy_color:
-                    moves.append(Move((row, col), (row + move_amount, col - 1), self.board))
-                if (row + move_amount, col - 1) == self.enpassant_possible:
-                    attacking_piece = blocking_piece = False
-                    if king_row == row:
-                        if king_col < col:  # king is left of the pawn
-                            # inside: between king and the pawn;
-                            # outside: between pawn and border;
-                            inside_range = range(king_col + 1, col - 1)
-                            outside_range = range(col + 1, 8)
-                        else:  # king right of the pawn
-                            inside_range = range(king_col - 1, col, -1)
-                            outside_range = range(col - 2, -1, -1)
-                        for i in inside_range:
-                            if self.board[row][i] != "--":  # some piece beside en-passant pawn blocks
-                                blocking_piece = True
-                        for i in outside_range:
-                            square = self.board[row][i]
-                            if square[0] == enemy_color and (square[1] == "R" or square[1] == "Q"):
-                                attacking_piece = True
-                            elif square != "--":
-                                blocking_piece = True
-                    if not attacking_piece or blocking_piece:
-                        moves.append(Move((row, col), (row + move_amount, col - 1), self.board, is_enpassant_move=True))
-        if col + 1 <= 7:  # capture to the right
-            if not piece_pinned or pin_direction == (move_amount, +1):
-                if self.board[row + move_amount][col + 1][0] == enemy_color:
-                    moves.append(Move((row, col), (row + move_amount, col + 1), self.board))
-                if (row + move_amount, col + 1) == self.enpassant_possible:
-                    attacking_piece = blocking_piece = False
-                    if king_row == row:
-                        if king_col < col:  # king is left of the pawn
-                            # inside: between king and the pawn;
-                            # outside: between pawn and border;
-                            inside_range = range(king_col + 1, col)
-                            outside_range = range(col + 2, 8)
-                        else:  # king right of the pawn
-                            inside_range = range(king_col - 1, col + 1, -1)
-                            outside_range = range(col - 1, -1, -1)
-                        for i in inside_range:
-                            if self.board[row][i] != "--":  # some piece beside en-passant pawn blocks
-                                blocking_piece = True
-                        for i in outside_range:
-                            square = self.board[row][i]
-                            if square[0] == enemy_color and (square[1] == "R" or square[1] == "Q"):
-                                attacking_piece = True
-                            elif square != "--":
-                                blocking_piece = True
-                    if not attacking_piece or blocking_piece:
-                        moves.append(Move((row, col), (row + move_amount, col + 1), self.board, is_enpassant_move=True))
-
-    def getRookMoves(self, row, col, moves):
+            ally_color, enemy_color = "b", "w"
+        square = row * 8 + col
+        occupied = self.color_bitboards["w"] | self.color_bitboards["b"]
+
+        one_step = square + 8 * move_amount
+        if not occupied & SQUARE_BITS[one_step]:  # 1 square pawn advance
+            if push_allowed & SQUARE_BITS[one_step]:
+                if SQUARE_BITS[one_step] & PROMOTION_SQUARES:
+                    self.addPromotionMoves((row, col), (row + move_amount, col), moves)
+                else:
+                    moves.append(Move((row, col), (row + move_amount, col), self.board))
+            two_steps = one_step + 8 * move_amount
+            if row == start_row and not occupied & SQUARE_BITS[two_steps] and allowed & targets & SQUARE_BITS[
+                    two_steps]:
+                moves.append(Move((row, col), (row + 2 * move_amount, col), self.board))
+        captures = PAWN_ATTACKS[ally_color][square] & allowed
+        enemy_captures = captures & self.color_bitboards[enemy_color] & targets
+        if enemy_captures & PROMOTION_SQUARES:
+            while enemy_captures:
+                end_square = (enemy_captures & -enemy_captures).bit_length() - 1
+                enemy_captures &= enemy_captures - 1
+                self.addPromotionMoves((row, col), SQUARE_COORDINATES[end_square], moves)
+        else:
+            self.addMoves(row, col, enemy_captures, moves)
+        if self.enpassant_possible:
+            enpassant_square = self.enpassant_possible[0] * 8 + self.enpassant_possible[1]
+            captured_square = row * 8 + self.enpassant_possible[1]
+            if captures & SQUARE_BITS[enpassant_square] and targets & (
+                    SQUARE_BITS[enpassant_square] | SQUARE_BITS[captured_square]) and not self.enpassantExposesKing(
+                    square, enpassant_square, captured_square):
+                moves.append(Move((row, col), self.enpassant_possible, self.board, is_enpassant_move=True))
+
+    def enpassantExposesKing(self, start_square, end_square, captured_square):
+        """
+        Determine if taking en-passant would uncover a slider attack on our king,
+        e.g. when both pawns leave the king's rank at once. The pin masks can't see this,
+        since neither pawn is pinned on its own.
+        """
+        if self.white_to_move:
+            ally_color, enemy_color = "w", "b"
+        else:
+            ally_color, enemy_color = "b", "w"
+        king_square = (self.bitboards[ally_color + "K"] & -self.bitboards[ally_color + "K"]).bit_length() - 1
+        occupied = self.color_bitboards["w"] | self.color_bitboards["b"]
+        occupied = (occupied & ~SQUARE_BITS[start_square] & ~SQUARE_BITS[captured_square]) | SQUARE_BITS[end_square]
+        enemy_queens = self.bitboards[enemy_color + "Q"]
+        if getRookAttacks(king_square, occupied) & (self.bitboards[enemy_color + "R"] | enemy_queens):
+            return True
+        return getBishopAttacks(king_square, occupied) & (self.bitboards[enemy_color + "B"] | enemy_queens) != 0
+
+    def getRookMoves(self, row, col, moves, targets=ALL_SQUARES):
         """
         Get all the rook moves for the rook located at row, col and add the moves to the list.
         """
-        piece_pinned = False
-        pin_direction = ()
-        for i in range(len(self.pins) - 1, -1, -1):
-            if self.pins[i][0] == row and self.pins[i][1] == col:
-                piece_pinned = True
-                pin_direction = (self.pins[i][2], self.pins[i][3])
-                if self.board[row][col][
-                    1] != "Q":  # can't remove queen from pin on rook moves, only remove it on bishop moves
-                    self.pins.remove(self.pins[i])
-                break
-
-        directions = ((-1, 0), (0, -1), (1, 0), (0, 1))  # up, left, down, right
-        enemy_color = "b" if self.white_to_move else "w"
-        for direction in directions:
-            for i in range(1, 8):
-                end_row = row + direction[0] * i
-                end_col = col + direction[1] * i
-                if 0 <= end_row <= 7 and 0 <= end_col <= 7:  # check for possible moves only in boundaries of the board
-                    if not piece_pinned or pin_direction == direction or pin_direction == (
-                            -direction[0], -direction[1]):
-                        end_piece = self.board[end_row][end_col]
-                        if end_piece == "--":  # empty space is valid
-                            moves.append(Move((row, col), (end_row, end_col), self.board))
-                        elif end_piece[0] == enemy_color:  # capture enemy piece
-                            moves.append(Move((row, col), (end_row, end_col), self.board))
-                            break
-                        else:  # friendly piece
-                            break
-                else:  # off board
-                    break
-
-    def getKnightMoves(self, row, col, moves):
+        ally_color = "w" if self.white_to_move else "b"
+        occupied = self.color_bitboards["w"] | self.color_bitboards["b"]
+        targets &= getRookAttacks(row * 8 + col, occupied) & ~self.color_bitboards[ally_color]
+        self.addMoves(row, col, targets & self.getPinMask(row, col), moves)
+
+    def getKnightMoves(self, row, col, moves, targets=ALL_SQUARES):
         """
         Get all the knight moves for the knight located at row col and add the moves to the list.
         """
-        piece_pinned = False
-        for i in range(len(self.pins) - 1, -1, -1):
-            if self.pins[i][0] == row and self.pins[i][1] == col:
-                piece_pinned = True
-                self.pins.remove(self.pins[i])
-                break
-
-        knight_moves = ((-2, -1), (-2, 1), (-1, 2), (1, 2), (2, -1), (2, 1), (-1, -2),
-                        (1, -2))  # up/left up/right right/up right/down down/left down/right left/up left/down
         ally_color = "w" if self.white_to_move else "b"
-        for move in knight_moves:
-            end_row = row + move[0]
-            end_col = col + move[1]
-            if 0 <= end_row <= 7 and 0 <= end_col <= 7:
-                if not piece_pinned:
-                    end_piece = self.board[end_row][end_col]
-                    if end_piece[0] != ally_color:  # so its either enemy piece or empty square
-                        moves.append(Move((row, col), (end_row, end_col), self.board))
+        targets &= KNIGHT_ATTACKS[row * 8 + col] & ~self.color_bitboards[ally_color]
+        # a pinned knight can never stay on its pin line, so the mask leaves no targets
+        self.addMoves(row, col, targets & self.getPinMask(row, col), moves)
 
-    def getBishopMoves(self, row, col, moves):
+    def getBishopMoves(self, row, col, moves, targets=ALL_SQUARES):
         """
         Get all the bishop moves for the bishop located at row col and add the moves to the list.
         """
-        piece_pinned = False
-        pin_direction = ()
-        for i in range(len(self.pins) - 1, -1, -1):
-            if self.pins[i][0] == row and self.pins[i][1] == col:
-                piece_pinned = True
-                pin_direction = (self.pins[i][2], self.pins[i][3])
-                self.pins.remove(self.pins[i])
-                break
-
-        directions = ((-1, -1), (-1, 1), (1, 1), (1, -1))  # diagonals: up/left up/right down/right down/left
-        enemy_color = "b" if self.white_to_move else "w"
-        for direction in directions:
-            for i in range(1, 8):
-                end_row = row + direction[0] * i
-                end_col = col + direction[1] * i
-                if 0 <= end_row <= 7 and 0 <= end_col <= 7:  # check if the move is on board
-                    if not piece_pinned or pin_direction == direction or pin_direction == (
-                            -direction[0], -direction[1]):
-                        end_piece = self.board[end_row][end_col]
-                        if end_piece == "--":  # empty space is valid
-                            moves.append(Move((row, col), (end_row, end_col), self.board))
-                        elif end_piece[0] == enemy_color:  # capture enemy piece
-                            moves.append(Move((row, col), (end_row, end_col), self.board))
-                            break
-                        else:  # friendly piece
-                            break
-                else:  # off board
-                    break
-
-    def getQueenMoves(self, row, col, moves):
+        ally_color = "w" if self.white_to_move else "b"
+        occupied = self.color_bitboards["w"] | self.color_bitboards["b"]
+        targets &= getBishopAttacks(row * 8 + col, occupied) & ~self.color_bitboards[ally_color]
+        self.addMoves(row, col, targets & self.getPinMask(row, col), moves)
+
+    def getQueenMoves(self, row, col, moves, targets=ALL_SQUARES):
         """
         Get all the queen moves for the queen located at row col and add the moves to the list.
         """
-        self.getBishopMoves(row, col, moves)
-        self.getRookMoves(row, col, moves)
+        ally_color = "w" if self.white_to_move else "b"
+        occupied = self.color_bitboards["w"] | self.color_bitboards["b"]
+        targets &= getQueenAttacks(row * 8 + col, occupied) & ~self.color_bitboards[ally_color]
+        self.addMoves(row, col, targets & self.getPinMask(row, col), moves)
 
-    def getKingMoves(self, row, col, moves):
+    def getKingMoves(self, row, col, moves, targets=ALL_SQUARES):
         """
         Get all the king moves for the king located at row col and add the moves to the list.
         """
-        row_moves = (-1, -1, -1, 0, 0, 1, 1, 1)
-        col_moves = (-1, 0, 1, -1, 1, -1, 0, 1)
         ally_color = "w" if self.white_to_move else "b"
-        for i in range(8):
-            end_row = row + row_moves[i]
-            end_col = col + col_moves[i]
-            if 0 <= end_row <= 7 and 0 <= end_col <= 7:
-                end_piece = self.board[end_row][end_col]
-                if end_piece[0] != ally_color:  # not an ally piece - empty or enemy
-                    # place king on end square and check for checks
-                    if ally_color == "w":
-                        self.white_king_location = (end_row, end_col)
-                    else:
-                        self.black_king_location = (end_row, end_col)
-                    in_check, pins, checks = self.checkForPinsAndChecks()
-                    if not in_check:
-                        moves.append(Move((row, col), (end_row, end_col), self.board))
-                    # place king back on original location
-                    if ally_color == "w":
-                        self.white_king_location = (row, col)
-                    else:
-                        self.black_king_location = (row, col)
+        targets &= KING_ATTACKS[row * 8 + col] & ~self.color_bitboards[ally_color]
+        if targets:
+            self.addMoves(row, col, targets & ~self.getKingDangerSquares(), moves)
 
     def getCastleMoves(self, row, col, moves):
         """
         Generate all valid castle moves for the king at (row, col) and add them to the list of moves.
         """
-        if self.squareUnderAttack(row, col):
+        if self.white_to_move:
+            can_castle_kingside = self.castling_rights & WHITE_KINGSIDE
+            can_castle_queenside = self.castling_rights & WHITE_QUEENSIDE
+        else:
+            can_castle_kingside = self.castling_rights & BLACK_KINGSIDE
+            can_castle_queenside = self.castling_rights & BLACK_QUEENSIDE
+        if not (can_castle_kingside or can_castle_queenside):
+            return
+        # the attack map of the king moves answers all the "is this square attacked" questions castling asks
+        attacked = self.getKingDangerSquares()
+        if attacked & SQUARE_BITS[row * 8 + col]:
             return  # can't castle while in check
-        if (self.white_to_move and self.current_castling_rights.wks) or (
-                not self.white_to_move and self.current_castling_rights.bks):
-            self.getKingsideCastleMoves(row, col, moves)
-        if (self.white_to_move and self.current_castling_rights.wqs) or (
-                not self.white_to_move and self.current_castling_rights.bqs):
-            self.getQueensideCastleMoves(row, col, moves)
-
-    def getKingsideCastleMoves(self, row, col, moves):
+        if can_castle_kingside:
+            self.getKingsideCastleMoves(row, col, moves, attacked)
+        if can_castle_queenside:
+            self.getQueensideCastleMoves(row, col, moves, attacked)
+
+    def getKingsideCastleMoves(self, row, col, moves, attacked):
         if self.board[row][col + 1] == '--' and self.board[row][col + 2] == '--':
-            if not self.squareUnderAttack(row, col + 1) and not self.squareUnderAttack(row, col + 2):
+            if not attacked & (SQUARE_BITS[row * 8 + col + 1] | SQUARE_BITS[row * 8 + col + 2]):
                 moves.append(Move((row, col), (row, col + 2), self.board, is_castle_move=True))
 
-    def getQueensideCastleMoves(self, row, col, moves):
+    def getQueensideCastleMoves(self, row, col, moves, attacked):
         if self.board[row][col - 1] == '--' and self.board[row][col - 2] == '--' and self.board[row][col - 3] == '--':
-            if not self.squareUnderAttack(row, col - 1) and not self.squareUnderAttack(row, col - 2):
+            if not attacked & (SQUARE_BITS[row * 8 + col - 1] | SQUARE_BITS[row * 8 + col - 2]):
                 moves.append(Move((row, col), (row, col - 2), self.board, is_castle_move=True))
 
 
-class CastleRights:
-    def __init__(self, wks, bks, wqs, bqs):
-        self.wks = wks
-        self.bks = bks
-        self.wqs = wqs
-        self.bqs = bqs
+class UndoRecord:
+    """
+    State makeMove overwrites and undoMove has to put back. GameState keeps a stack of these
+    and reuses them, so making a move doesn't allocate anything for its undo information.
+    """
+    __slots__ = ("piece_captured", "castling_rights", "enpassant_possible", "zobrist_key", "halfmove_clock")
+
+    def __init__(self):
+        self.piece_captured = "--"
+        self.castling_rights = 0
+        self.enpassant_possible = ()
+        self.zobrist_key = 0
+        self.halfmove_clock = 0
 
 
 class Move:
@@ -572,8 +1091,14 @@ class Move:
     files_to_cols = {"a": 0, "b": 1, "c": 2, "d": 3,
                      "e": 4, "f": 5, "g": 6, "h": 7}
     cols_to_files = {v: k for k, v in files_to_cols.items()}
+    promotion_codes = {"Q": 0, "R": 1, "B": 2, "N": 3}
 
-    def __init__(self, start_square, end_square, board, is_enpassant_move=False, is_castle_move=False):
+    # no per-instance __dict__: the search creates and throws away a lot of moves
+    __slots__ = ("start_row", "start_col", "end_row", "end_col", "piece_moved", "piece_captured", "is_pawn_promotion",
+                 "is_enpassant_move", "is_castle_move", "is_capture", "promotion_piece", "moveID")
+
+    def __init__(self, start_square, end_square, board, is_enpassant_move=False, is_castle_move=False,
+                 promotion_piece="Q"):
         self.start_row = start_square[0]
         self.start_col = start_square[1]
         self.end_row = end_square[0]
@@ -583,6 +1108,7 @@ class Move:
         # pawn promotion
         self.is_pawn_promotion = (self.piece_moved == "wp" and self.end_row == 0) or (
                 self.piece_moved == "bp" and self.end_row == 7)
+        self.promotion_piece = promotion_piece if self.is_pawn_promotion else ""
         # en passant
         self.is_enpassant_move = is_enpassant_move
         if self.is_enpassant_move:
@@ -591,7 +1117,11 @@ class Move:
         self.is_castle_move = is_castle_move
 
         self.is_capture = self.piece_captured != "--"
-        self.moveID = self.start_row * 1000 + self.start_col * 100 + self.end_row * 10 + self.end_col
+        # packed into 14 bits: start square, end square and promotion piece (0 for queen or no promotion).
+        # En-passant and castling follow from the position, so a move built from just the two squares
+        # (like the ones the player makes) equals the generated one.
+        self.moveID = (self.start_row * 8 + self.start_col) | (self.end_row * 8 + self.end_col) << 6 | (
+                self.promotion_codes[promotion_piece] << 12 if self.is_pawn_promotion else 0)
 
     def __eq__(self, other):
         """
@@ -601,11 +1131,14 @@ class Move:
             return self.moveID == other.moveID
         return False
 
+    def __hash__(self):
+        return self.moveID
+
     def getChessNotation(self):
         if self.is_pawn_promotion:
-            return self.getRankFile(self.end_row, self.end_col) + "Q"
+            return self.getRankFile(self.end_row, self.end_col) + self.promotion_piece
         if self.is_castle_move:
-            if self.end_col == 1:
+            if self.end_col == 2:
                 return "0-0-0"
             else:
                 return "0-0"
@@ -637,11 +1170,11 @@ class Move:
 
         if self.piece_moved[1] == "p":
             if self.is_capture:
-                return self.cols_to_files[self.start_col] + "x" + end_square
+                return self.cols_to_files[self.start_col] + "x" + end_square + self.promotion_piece
             else:
-                return end_square + "Q" if self.is_pawn_promotion else end_square
+                return end_square + self.promotion_piece
 
         move_string = self.piece_moved[1]
         if self.is_capture:
             move_string += "x"
-        return move_string + end_square
\ No newline at end of file
+        return move_string + end_square
@@ -0,0 +1,254 @@
+"""
+Endgame tablebases: the exact result and distance to mate of every KQK, KRK and KPK position.
+
+The tables are generated here by retrograde analysis: start from the mates and walk the moves backwards,
+a position where the weak side is to move is lost once all its moves lead to positions the strong side wins.
+They are written to one file per material signature, one byte per position: 0 for a draw,
+otherwise 1 + the number of plies to mate. The strong side is always stored as white, and the board is
+mirrored so the white king (the pawn in KPK) is on the a-d files, which halves the files.
+The files are memory-mapped when probing.
+
+    python endgame_tablebase.py    generate the tables into the tablebases directory
+"""
+import mmap
+import os
+import time
+from chess_engine import KING_ATTACKS, PAWN_ATTACKS, SQUARE_BITS, getQueenAttacks, getRookAttacks
+
+TABLEBASE_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tablebases")
+# piece of the strong side -> table name, KPK needs the other two for its promotions
+TABLE_NAMES = {"Q": "KQK", "R": "KRK", "p": "KPK"}
+TABLE_SIZE = 32 * 64 * 64 * 2  # key square on the a-d files, the other two squares, side to move
+
+# results, from the point of view of the side to move
+WIN = 1
+DRAW = 0
+LOSS = -1
+
+ESCAPE = 100  # move counter of weak side positions that can take the piece, it never counts down to 0
+
+
+def getIndex(white_king, black_king, piece, black_to_move):
+    """
+    Index of a position in the full, unmirrored table used while generating.
+    """
+    return ((white_king * 64 + black_king) * 64 + piece) * 2 + black_to_move
+
+
+def getFileIndex(piece_type, white_king, black_king, piece, black_to_move):
+    """
+    Index of a position in a table file, after mirroring it onto the a-d files.
+    """
+    key_square = piece if piece_type == "p" else white_king
+    if key_square % 8 >= 4:  # mirror left to right
+        white_king ^= 7
+        black_king ^= 7
+        piece ^= 7
+        key_square ^= 7
+    key_index = key_square // 8 * 4 + key_square % 8
+    if piece_type == "p":
+        return ((key_index * 64 + white_king) * 64 + black_king) * 2 + black_to_move
+    return ((key_index * 64 + black_king) * 64 + piece) * 2 + black_to_move
+
+
+def getWhiteAttacks(piece_type, white_king, piece, occupied):
+    if piece_type == "Q":
+        attacks = getQueenAttacks(piece, occupied)
+    elif piece_type == "R":
+        attacks = getRookAttacks(piece, occupied)
+    else:
+        attacks = PAWN_ATTACKS["w"][piece]
+    return KING_ATTACKS[white_king] | attacks
+
+
+def generateTable(piece_type, promotion_tables=None):
+    """
+    Solve king and piece_type against king, with white as the strong side.
+    Returns the full table as a bytearray indexed by getIndex, values as in the files.
+    promotion_tables ({"Q": table, "R": table}) gives KPK the results after the pawn promotes.
+    """
+    values = bytearray(64 * 64 * 64 * 2)
+    counters = bytearray(64 * 64 * 64 * 2)  # weak side to move: moves not yet known to lose
+    buckets = [[] for distance in range(256)]  # positions to expand, by distance to mate
+
+    # weak side to move: count the moves, find the mates; strong side to move: promotions
+    for white_king in range(64):
+        for black_king in range(64):
+            if black_king == white_king or KING_ATTACKS[white_king] & SQUARE_BITS[black_king]:
+                continue
+            for piece in range(64):
+                if piece == white_king or piece == black_king:
+                    continue
+                if piece_type == "p" and not 8 <= piece < 56:
+                    continue
+                piece_bit = SQUARE_BITS[piece]
+                # the black king is left out, so it can't hide behind itself from a slider
+                attacks = getWhiteAttacks(piece_type, white_king, piece, SQUARE_BITS[white_king] | piece_bit)
+                index = getIndex(white_king, black_king, piece, 1)
+                if piece_bit & KING_ATTACKS[black_king] and not piece_bit & KING_ATTACKS[white_king]:
+                    counters[index] = ESCAPE  # the piece hangs, black takes it and it's a draw
+                else:
+                    moves = KING_ATTACKS[black_king] & ~attacks & ~piece_bit
+                    counters[index] = bin(moves).count("1")
+                    if not moves and attacks & SQUARE_BITS[black_king]:  # checkmate
+                        values[index] = 1
+                        buckets[0].append(index)
+                if piece_type == "p" and piece < 16 and not attacks & SQUARE_BITS[black_king]:
+                    promotion_square = piece - 8
+                    if promotion_square != white_king and promotion_square != black_king:
+                        for table in promotion_tables.values():
+                            value = table[getIndex(white_king, black_king, promotion_square, 1)]
+                            if value:
+                                # promoting wins in one ply more than the position after it
+                                index = getIndex(white_king, black_king, piece, 0)
+                                if not values[index] or values[index] > value + 1:
+                                    values[index] = value + 1
+                                    buckets[value].append(index)
+
+    for distance in range(255):
+        for index in buckets[distance]:
+            black_to_move = index & 1
+            piece = (index >> 1) & 63
+            black_king = (index >> 7) & 63
+            white_king = index >> 13
+            if values[index] != distance + 1:
+                continue  # reached again later with a shorter mate
+            occupied = SQUARE_BITS[white_king] | SQUARE_BITS[black_king] | SQUARE_BITS[piece]
+            if black_to_move:
+                # lost for black: every white move leading here wins for white, one ply further from mate
+                predecessors = []
+                sources = KING_ATTACKS[white_king] & ~occupied
+                while sources:
+                    square = (sources & -sources).bit_length() - 1
+                    sources &= sources - 1
+                    predecessors.append((square, piece))
+                if piece_type == "p":
+                    if piece + 8 < 56 and not occupied & SQUARE_BITS[piece + 8]:
+                        predecessors.append((white_king, piece + 8))
+                        if piece // 8 == 4 and not occupied & SQUARE_BITS[piece + 16]:
+                            predecessors.append((white_king, piece + 16))
+                else:
+                    if piece_type == "Q":
+                        sources = getQueenAttacks(piece, occupied) & ~occupied
+                    else:
+                        sources = getRookAttacks(piece, occupied) & ~occupied
+                    while sources:
+                        square = (sources & -sources).bit_length() - 1
+                        sources &= sources - 1
+                        predecessors.append((white_king, square))
+                for previous_king, previous_piece in predecessors:
+                    previous_occupied = SQUARE_BITS[previous_king] | SQUARE_BITS[previous_piece]
+                    # black can't have been left in check by its own move
+                    if getWhiteAttacks(piece_type, previous_king, previous_piece, previous_occupied) & SQUARE_BITS[
+                            black_king]:
+                        continue
+                    previous = getIndex(previous_king, black_king, previous_piece, 0)
+                    if not values[previous] or values[previous] > distance + 2:
+                        values[previous] = distance + 2
+                        buckets[distance + 1].append(previous)
+            else:
+                # won for white: the black king moves that led here lose one more of black's options
+                sources = KING_ATTACKS[black_king] & ~occupied & ~KING_ATTACKS[white_king]
+                while sources:
+                    square = (sources & -sources).bit_length() - 1
+                    sources &= sources - 1
+                    previous = getIndex(white_king, square, piece, 1)
+                    if values[previous]:
+                        continue
+                    counters[previous] -= 1
+                    if counters[previous] == 0:
+                        values[previous] = distance + 2
+                        buckets[distance + 1].append(previous)
+        buckets[distance] = None
+    return values
+
+
+def writeTable(piece_type, values, directory=TABLEBASE_DIRECTORY):
+    """
+    Mirror the full table down to the a-d files and write it out.
+    """
+    table = bytearray(TABLE_SIZE)
+    for white_king in range(64):
+        for black_king in range(64):
+            for piece in range(64):
+                key_square = piece if piece_type == "p" else white_king
+                if key_square % 8 >= 4:
+                    continue
+                for black_to_move in (0, 1):
+                    table[getFileIndex(piece_type, white_king, black_king, piece, black_to_move)] = values[
+                        getIndex(white_king, black_king, piece, black_to_move)]
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, TABLE_NAMES[piece_type] + ".tb"), "wb") as table_file:
+        table_file.write(table)
+
+
+def generateAll(directory=TABLEBASE_DIRECTORY):
+    tables = {}
+    for piece_type in ("Q", "R", "p"):
+        start_time = time.time()
+        promotion_tables = {"Q": tables["Q"], "R": tables["R"]} if piece_type == "p" else None
+        tables[piece_type] = generateTable(piece_type, promotion_tables)
+        writeTable(piece_type, tables[piece_type], directory)
+        longest = max(tables[piece_type]) - 1
+        print("{}: longest mate {} plies, {:.1f}s".format(TABLE_NAMES[piece_type], longest, time.time() - start_time))
+
+
+class EndgameTablebases:
+    """
+    Probes the generated tables. Tables whose file is missing are simply not probed.
+    Any object with the same probe method can take its place in chess_ai.
+    """
+
+    def __init__(self, directory=TABLEBASE_DIRECTORY):
+        self.files = []
+        self.tables = {}  # piece type of the strong side -> memory-mapped table
+        for piece_type, name in TABLE_NAMES.items():
+            path = os.path.join(directory, name + ".tb")
+            if not os.path.exists(path) or os.path.getsize(path) != TABLE_SIZE:
+                continue
+            table_file = open(path, "rb")
+            self.files.append(table_file)
+            self.tables[piece_type] = mmap.mmap(table_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def probe(self, game_state):
+        """
+        (result, plies to mate) of the position for the side to move, (DRAW, 0) for a draw,
+        or None if there is no table for its material.
+        """
+        bitboards = game_state.bitboards
+        occupied = game_state.color_bitboards["w"] | game_state.color_bitboards["b"]
+        pieces = occupied & ~(bitboards["wK"] | bitboards["bK"])
+        if pieces & (pieces - 1):  # more than one piece besides the kings
+            return None
+        if not pieces:
+            return DRAW, 0
+        square = pieces.bit_length() - 1
+        piece = game_state.board[square // 8][square % 8]
+        if piece[1] in "BN":  # a lone minor piece can't mate
+            return DRAW, 0
+        table = self.tables.get(piece[1])
+        if table is None:
+            return None
+        white_king = bitboards[piece[0] + "K"].bit_length() - 1
+        black_king = bitboards[("b" if piece[0] == "w" else "w") + "K"].bit_length() - 1
+        strong_to_move = game_state.white_to_move == (piece[0] == "w")
+        if piece[0] == "b":  # flip the board so the strong side plays up the board as white
+            white_king ^= 56
+            black_king ^= 56
+            square ^= 56
+        value = table[getFileIndex(piece[1], white_king, black_king, square, 0 if strong_to_move else 1)]
+        if not value:
+            return DRAW, 0
+        return (WIN if strong_to_move else LOSS), value - 1
+
+    def close(self):
+        for table in self.tables.values():
+            table.close()
+        for table_file in self.files:
+            table_file.close()
+        self.tables = {}
+        self.files = []
+
+
+if __name__ == "__main__":
+    generateAll()
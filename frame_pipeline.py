@@ -0,0 +1,188 @@
+import queue
+import threading
+import time
+
+QUEUE_SIZE = 2  # frames waiting between two stages, more only adds lag
+MAX_FRAME_AGE = 0.25  # seconds, a stage drops frames this old instead of showing them late
+
+
+class Frame:
+    """
+    One camera frame and everything the stages work out for it, passed from stage to stage.
+    Only the stage holding a frame touches it.
+    """
+
+    def __init__(self, sequence, timestamp, image):
+        self.sequence = sequence  # frames are numbered in capture order, from 1
+        self.timestamp = timestamp  # capture time
+        self.image = image  # BGR camera image, the stages draw onto it
+        # hand tracking
+        self.pinch_detected = False
+        self.pinch_location = None
+        # board
+        self.status_text = ""
+        self.ai_enabled = False
+        self.ai_thinking = False
+        self.overlay = None  # board overlay buffer, from the compositor
+        # compose
+        self.output = None  # the finished BGR image to show
+        self.release_callbacks = []  # free what the frame holds once it leaves the pipeline
+
+    def get_age(self):
+        return time.time() - self.timestamp
+
+    def release(self):
+        """Called when the frame is dropped or has been shown"""
+        for callback in self.release_callbacks:
+            callback()
+        self.release_callbacks = []
+
+
+def put_latest(frame_queue, frame):
+    """Puts a frame on a bounded queue, dropping the oldest waiting frame if it's full"""
+    while True:
+        try:
+            frame_queue.put_nowait(frame)
+            return
+        except queue.Full:
+            try:
+                frame_queue.get_nowait().release()
+            except queue.Empty:
+                pass
+
+
+class PipelineStage:
+    """
+    A step of the pipeline: function(frame) runs on the stage's worker threads and returns the frame for
+    the next stage, or None to drop it. An ordered stage never handles a frame older than one it has
+    already started, which the stages that keep state from frame to frame need.
+    """
+
+    def __init__(self, name, function, workers=1, ordered=False):
+        self.name = name
+        self.function = function
+        self.workers = workers
+        self.ordered = ordered
+        self.input = queue.Queue(maxsize=QUEUE_SIZE)
+        self.output = None  # input queue of the next stage
+        self.lock = threading.Lock()
+        self.last_sequence = 0
+        self.frames_processed = 0
+        self.frames_dropped = 0
+
+    def _accept(self, frame):
+        with self.lock:
+            if frame.get_age() > MAX_FRAME_AGE or (self.ordered and frame.sequence <= self.last_sequence):
+                self.frames_dropped += 1
+                return False
+            self.last_sequence = max(self.last_sequence, frame.sequence)
+            return True
+
+    def _run(self, pipeline):
+        while not pipeline.stop_event.is_set():
+            try:
+                frame = self.input.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if not self._accept(frame):
+                frame.release()
+                continue
+            try:
+                result = self.function(frame)
+            except Exception as error:
+                frame.release()
+                pipeline.fail(error)
+                return
+            with self.lock:
+                self.frames_processed += 1
+            if result is None:
+                frame.release()
+            else:
+                put_latest(self.output, result)
+
+
+class FramePipeline:
+    """
+    Runs read_frame() -> (image, timestamp) on a capture thread and feeds the frames through the stages,
+    each on its own worker threads with a bounded queue in front of it, so one frame can be tracked while
+    the one before it is composed and shown. OpenCV and MediaPipe release the GIL while they work, so the
+    stages really run at the same time. The caller takes the finished frames from get(), in order.
+    """
+
+    def __init__(self, read_frame, stages):
+        self.read_frame = read_frame
+        self.stages = stages
+        self.output = queue.Queue(maxsize=QUEUE_SIZE)
+        for stage, next_stage in zip(stages, stages[1:]):
+            stage.output = next_stage.input
+        stages[-1].output = self.output
+        self.stop_event = threading.Event()
+        self.threads = []
+        self.error = None
+        self.last_sequence = 0  # last frame get() returned
+        self.frames_shown = 0
+        self.start_time = None
+
+    def start(self):
+        self.start_time = time.time()
+        self.threads = [threading.Thread(target=self._read_loop, daemon=True)]
+        for stage in self.stages:
+            for worker in range(stage.workers):
+                self.threads.append(threading.Thread(target=stage._run, args=(self,), daemon=True))
+        for thread in self.threads:
+            thread.start()
+
+    def _read_loop(self):
+        sequence = 0
+        while not self.stop_event.is_set():
+            try:
+                image, timestamp = self.read_frame()
+            except Exception as error:
+                self.fail(error)
+                return
+            if image is None:
+                continue
+            sequence += 1
+            put_latest(self.stages[0].input, Frame(sequence, timestamp, image))
+
+    def fail(self, error):
+        """Stops the pipeline because a stage raised, get() raises the error in the caller's thread"""
+        if self.error is None:
+            self.error = error
+        self.stop_event.set()
+
+    def get(self, timeout=0.1):
+        """
+        The next finished frame, or None if there is none yet. Frames that finished after a newer one
+        (parallel workers can overtake each other) are dropped. Release the frame once it has been shown.
+        """
+        deadline = time.time() + timeout
+        while True:
+            if self.error is not None:
+                raise self.error
+            try:
+                frame = self.output.get(timeout=max(deadline - time.time(), 0))
+            except queue.Empty:
+                return None
+            if frame.sequence > self.last_sequence:
+                self.last_sequence = frame.sequence
+                self.frames_shown += 1
+                return frame
+            frame.release()
+
+    def get_stats(self):
+        """Frames per second shown, and frames processed and dropped by every stage"""
+        elapsed = time.time() - self.start_time if self.start_time else 0
+        stats = {"fps": self.frames_shown / elapsed if elapsed > 0 else 0.0}
+        for stage in self.stages:
+            stats[stage.name] = {"processed": stage.frames_processed, "dropped": stage.frames_dropped}
+        return stats
+
+    def stop(self):
+        self.stop_event.set()
+        for thread in self.threads:
+            thread.join(timeout=1.0)
+        self.threads = []
+        for frame_queue in [stage.input for stage in self.stages] + [self.output]:
+            while not frame_queue.empty():
+                frame_queue.get_nowait().release()
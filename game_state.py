@@ -1,7 +1,7 @@
 from chess_engine import GameState, Move
 import threading
 import queue
-from chess_ai import findBestMove
+from chess_ai import findBestMove, findBestMoveParallel, ponderMove, startSearchPool, TIME_BUDGET
 import time
 
 # Initialize the chess engine
@@ -11,12 +11,31 @@ selected_piece = None
 selected_piece_pos = None  # (row, col)
 dragging = False
 drag_offset = (0, 0)
-SQUARE_SIZE = 200  # Size of each square on the board
+SQUARE_SIZE = 200  # Size of each square on the board, set_square_size makes it match the display
 
 # Add these globals after existing ones
 ai_enabled = False
 ai_thinking = False
 ai_move_queue = queue.Queue()
+# 0 searches in a thread of this process, more splits the root moves over that many worker processes
+AI_SEARCH_PROCESSES = 0
+AI_MIN_THINKING_TIME = 1.0  # seconds the AI appears to think, even when it finds its move sooner
+ai_request_time = 0.0
+ai_pending_move = None  # move taken from ai_move_queue, waiting for the minimum thinking time to pass
+ai_request_position = None  # get_position_id() of the position the AI is searching
+# search on the human's time, after the AI has moved and until the human has (single process search only).
+# It runs on a thread of this process and competes with hand tracking and drawing for the interpreter,
+# for at most chess_ai.PONDER_TIME_LIMIT seconds; in return a predicted reply is answered at once
+AI_PONDER = True
+ponder_thread = None
+ponder_stop_event = None
+ponder_results = {}  # filled in by ponderMove
+ponder_move_count = 0  # length of the move log when pondering started
+ai_ponder_hit = False  # the move being played came from pondering, it's played without the minimum thinking time
+
+def get_position_id():
+    """Identifies the current position of the live game: move count plus Zobrist hash"""
+    return len(chess_engine.move_log), chess_engine.zobrist_key
 
 def get_board():
     # Convert chess engine board format to your display format
@@ -35,6 +54,11 @@ def get_board():
         display_board.append(display_row)
     return display_board
 
+def set_square_size(size):
+    """Board coordinates of pinches are turned into squares with the size the display draws them at"""
+    global SQUARE_SIZE
+    SQUARE_SIZE = size
+
 def get_selected_piece():
     return selected_piece
 
@@ -115,11 +139,8 @@ def handle_pinch_move(pinch_location):
 def get_valid_moves_for_selected():
     """Returns all valid moves for the currently selected piece"""
     if selected_piece and selected_piece_pos:
-        valid_moves = chess_engine.getValidMoves()
-        row, col = selected_piece_pos
-        # Filter moves that start from the selected position
-        return [move for move in valid_moves 
-                if move.start_row == row and move.start_col == col]
+        # Moves are cached per position and grouped by start square, so this is a lookup
+        return chess_engine.getValidMovesByOrigin().get(selected_piece_pos, [])
     return []
 
 def get_king_position():
@@ -144,11 +165,11 @@ def handle_pinch_end(pinch_location):
             if 0 <= end_row < 8 and 0 <= end_col < 8:
                 # Create move and check if valid
                 move = Move((start_row, start_col), (end_row, end_col), chess_engine.board)
-                valid_moves = chess_engine.getValidMoves()
+                valid_moves = chess_engine.getValidMovesByOrigin().get((start_row, start_col), [])
                 
                 if move in valid_moves:
-                    # Make the move in the chess engine
-                    chess_engine.makeMove(move)
+                    # Make the generated move, it knows about castling and en-passant, the one built here doesn't
+                    chess_engine.makeMove(valid_moves[valid_moves.index(move)])
                     print(f"Valid move: {move.getChessNotation()}")
                 else:
                     print(f"Invalid move attempted: {start_row},{start_col} to {end_row},{end_col}")
@@ -162,6 +183,13 @@ def handle_pinch_end(pinch_location):
 def toggle_ai():
     global ai_enabled
     ai_enabled = not ai_enabled
+    if not ai_enabled and ponder_stop_event is not None:
+        ponder_stop_event.set()  # nobody is going to use the result
+    if ai_enabled and AI_SEARCH_PROCESSES:
+        # spawn the search workers now, in the background, the first search's time budget isn't meant for it
+        pool_thread = threading.Thread(target=startSearchPool, args=(AI_SEARCH_PROCESSES,))
+        pool_thread.daemon = True
+        pool_thread.start()
     return ai_enabled
 
 def is_ai_enabled():
@@ -171,30 +199,100 @@ def is_ai_thinking():
     return ai_thinking
 
 def get_ai_move():
-    if not ai_move_queue.empty():
-        return ai_move_queue.get()
-    return None
+    try:
+        return ai_move_queue.get_nowait()
+    except queue.Empty:
+        return None
+
+def start_pondering():
+    """Starts searching the human's expected reply in the background, right after the AI has moved"""
+    global ponder_thread, ponder_stop_event, ponder_results, ponder_move_count
+    if not AI_PONDER or AI_SEARCH_PROCESSES or ponder_thread is not None:
+        return
+    ponder_stop_event = threading.Event()
+    ponder_results = {}
+    ponder_move_count = len(chess_engine.move_log)
+    # the snapshot is the only work done here, predicting the reply and searching happen in the thread
+    ponder_thread = threading.Thread(target=ponderMove, args=(chess_engine.copy(), ponder_results, ponder_stop_event))
+    ponder_thread.daemon = True
+    ponder_thread.start()
+
+def think(search_state, valid_moves, ponder, ponder_stop, ponder_hit_results):
+    """
+    AI thread: stops pondering first, the two searches share the search tables. If the human played the
+    expected reply and the ponder search already thought for a full move, its move is played, otherwise
+    this searches for the rest of the time budget, starting from what pondering put in the transposition table.
+    """
+    global ai_ponder_hit
+    time_budget = TIME_BUDGET
+    if ponder is not None:
+        ponder_stop.set()
+        ponder.join()
+    # without a finished iteration the move is just the first one, never searched
+    if ponder_hit_results and "move" in ponder_hit_results and ponder_hit_results.get("depth", 0) > 0:
+        move = ponder_hit_results["move"]
+        if ponder_hit_results["time"] >= TIME_BUDGET and move in valid_moves:
+            print(f"Ponder hit, AI plays {move.getChessNotation()} searched to depth {ponder_hit_results['depth']}")
+            # the human already waited while it was found, so it's played right away
+            ai_ponder_hit = True
+            ai_move_queue.put(valid_moves[valid_moves.index(move)])
+            return
+        time_budget = max(TIME_BUDGET - ponder_hit_results["time"], TIME_BUDGET / 4)
+    findBestMove(search_state, valid_moves, ai_move_queue, time_budget)
 
 def request_ai_move():
-    global ai_thinking
+    global ai_thinking, ai_request_time, ai_request_position, ponder_thread, ai_ponder_hit
+    if chess_engine.checkmate or chess_engine.stalemate:  # the game is over, nothing to ask for every frame
+        return False
     print(f"AI enabled: {ai_enabled}, Current player: {'White' if chess_engine.white_to_move else 'Black'}")
     if not ai_thinking and is_ai_enabled() and chess_engine.white_to_move == False:
+        # the live moves are cached, so this is cheap; checkmate or stalemate leaves nothing to search
+        if not chess_engine.getValidMoves():
+            return False
         print("Starting AI move calculation...")
+        # the AI searches its own copy, the frame loop keeps reading the live chess_engine meanwhile
+        search_state = chess_engine.copy()
+        valid_moves = search_state.getValidMoves()
         ai_thinking = True
-        valid_moves = chess_engine.getValidMoves()
-        ai_thread = threading.Thread(target=findBestMove, args=(chess_engine, valid_moves, ai_move_queue))
+        ai_ponder_hit = False
+        ai_request_time = time.time()
+        ai_request_position = get_position_id()
+        if AI_SEARCH_PROCESSES:
+            ai_thread = threading.Thread(target=findBestMoveParallel, args=(search_state, valid_moves, ai_move_queue),
+                                         kwargs={"processes": AI_SEARCH_PROCESSES})
+        else:
+            ponder_hit = (ponder_results.get("key") == chess_engine.zobrist_key
+                          and len(chess_engine.move_log) == ponder_move_count + 1)
+            ai_thread = threading.Thread(target=think, args=(search_state, valid_moves, ponder_thread,
+                                                             ponder_stop_event, ponder_results if ponder_hit else None))
+            ponder_thread = None
         ai_thread.daemon = True
         ai_thread.start()
         return True
     return False
 
 def make_ai_move():
-    global ai_thinking
-    time.sleep(5)  
-    if ai_thinking:
-        ai_move = get_ai_move()
-        if ai_move:
-            chess_engine.makeMove(ai_move)
-            ai_thinking = False
-            return True
-    return False
\ No newline at end of file
+    """
+    Called every frame: plays the AI's move once the search has posted it and the minimum
+    thinking time has passed (ponder hits don't wait for it). Never waits, so the frame loop keeps
+    running while the AI thinks.
+    """
+    global ai_thinking, ai_pending_move, ai_ponder_hit
+    if not ai_thinking:
+        return False
+    if ai_pending_move is None:
+        ai_pending_move = get_ai_move()
+        if ai_pending_move is None:
+            return False
+    if not ai_ponder_hit and time.time() - ai_request_time < AI_MIN_THINKING_TIME:
+        return False
+    # only the main thread changes the live game, and only if it is still the position the AI searched
+    if get_position_id() == ai_request_position:
+        chess_engine.makeMove(ai_pending_move)
+        start_pondering()
+    else:
+        print("Position changed while the AI was thinking, discarding its move")
+    ai_pending_move = None
+    ai_thinking = False
+    ai_ponder_hit = False
+    return True
\ No newline at end of file
@@ -3,16 +3,26 @@ import math
 
 mp_drawing_styles = mp.solutions.drawing_styles
 mp_hands = mp.solutions.hands
-hands = mp_hands.Hands(static_image_mode=False,
-                      max_num_hands=1,
-                      min_detection_confidence=0.7,
-                      min_tracking_confidence=0.7)
 mp_drawing = mp.solutions.drawing_utils
 
 PINCH_THRESHOLD = 0.05
 
-def detect_hands(image_rgb):
-    return hands.process(image_rgb)
+def create_hands():
+    # a Hands model tracks one stream of frames and isn't thread safe, every tracking thread needs its own
+    return mp_hands.Hands(static_image_mode=False,
+                          max_num_hands=1,
+                          min_detection_confidence=0.7,
+                          min_tracking_confidence=0.7)
+
+hands = None  # default model, created on first use so importing this module doesn't load one
+
+def detect_hands(image_rgb, hands_model=None):
+    global hands
+    if hands_model is None:
+        if hands is None:
+            hands = create_hands()
+        hands_model = hands
+    return hands_model.process(image_rgb)
 
 def draw_landmarks(image, results):
     if results.multi_hand_landmarks:
@@ -34,5 +44,10 @@ def is_pinching(hand_landmarks, width, height):
         return distance < PINCH_THRESHOLD, (pinch_point_x, pinch_point_y)
     return False, None
 
-def close_hands():
-    hands.close()   
\ No newline at end of file
+def close_hands(hands_model=None):
+    global hands
+    if hands_model is not None:
+        hands_model.close()
+    elif hands is not None:
+        hands.close()
+        hands = None   
\ No newline at end of file
@@ -0,0 +1,150 @@
+"""
+Opening book: moves the AI can play in the opening without searching.
+
+The book file has the Polyglot layout, a sorted array of 16 byte big-endian entries
+(key 8 bytes, move 2, weight 2, learn 4), but the key is GameState.zobrist_key and the move is Move.moveID,
+so the engine doesn't need a second hashing scheme. Polyglot books made by other programs are keyed by
+Polyglot's own random numbers and can't be read.
+The file is memory-mapped and binary-searched, opening it doesn't read it into memory.
+
+    python opening_book.py    rebuild opening_book.bin from BOOK_LINES
+"""
+import mmap
+import os
+import random
+import struct
+from chess_engine import GameState, Move
+
+BOOK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "opening_book.bin")
+ENTRY = struct.Struct(">QHHI")  # key, move, weight, learn
+MAX_WEIGHT = 0xFFFF
+
+# main lines of common openings in long algebraic notation, a move gets more weight the more lines play it
+BOOK_LINES = (
+    "e2e4 e7e5 g1f3 b8c6 f1b5 a7a6 b5a4 g8f6 e1g1 f8e7 f1e1 b7b5 a4b3 d7d6 c2c3 e8g8",
+    "e2e4 e7e5 g1f3 b8c6 f1b5 g8f6 e1g1 f6e4 d2d4 e4d6 b5c6 d7c6 d4e5 d6f5",
+    "e2e4 e7e5 g1f3 b8c6 f1c4 f8c5 c2c3 g8f6 d2d3 d7d6 e1g1 e8g8",
+    "e2e4 e7e5 g1f3 b8c6 f1c4 g8f6 d2d3 f8e7 e1g1 e8g8 f1e1 d7d6",
+    "e2e4 e7e5 g1f3 b8c6 d2d4 e5d4 f3d4 g8f6 d4c6 b7c6 e4e5 d8e7",
+    "e2e4 e7e5 g1f3 g8f6 f3e5 d7d6 e5f3 f6e4 d2d4 d6d5 f1d3 b8c6",
+    "e2e4 e7e5 b1c3 g8f6 f2f4 d7d5 f4e5 f6e4 g1f3 f8e7",
+    "e2e4 c7c5 g1f3 d7d6 d2d4 c5d4 f3d4 g8f6 b1c3 a7a6 c1e3 e7e5 d4b3 c8e6",
+    "e2e4 c7c5 g1f3 b8c6 d2d4 c5d4 f3d4 g8f6 b1c3 e7e5 d4b5 d7d6 c1g5 a7a6",
+    "e2e4 c7c5 g1f3 e7e6 d2d4 c5d4 f3d4 b8c6 b1c3 d8c7 f1e2 a7a6",
+    "e2e4 c7c5 b1c3 b8c6 g2g3 g7g6 f1g2 f8g7 d2d3 d7d6",
+    "e2e4 c7c5 c2c3 g8f6 e4e5 f6d5 d2d4 c5d4 g1f3 b8c6",
+    "e2e4 e7e6 d2d4 d7d5 b1c3 g8f6 c1g5 f8e7 e4e5 f6d7 g5e7 d8e7",
+    "e2e4 e7e6 d2d4 d7d5 b1d2 g8f6 e4e5 f6d7 f1d3 c7c5 c2c3 b8c6",
+    "e2e4 c7c6 d2d4 d7d5 b1c3 d5e4 c3e4 c8f5 e4g3 f5g6 h2h4 h7h6",
+    "e2e4 c7c6 d2d4 d7d5 e4e5 c8f5 g1f3 e7e6 f1e2 c6c5",
+    "e2e4 d7d5 e4d5 d8d5 b1c3 d5a5 d2d4 g8f6 g1f3 c8f5",
+    "e2e4 d7d6 d2d4 g8f6 b1c3 g7g6 g1f3 f8g7 f1e2 e8g8 e1g1",
+    "d2d4 d7d5 c2c4 e7e6 b1c3 g8f6 c1g5 f8e7 e2e3 e8g8 g1f3 b8d7",
+    "d2d4 d7d5 c2c4 c7c6 g1f3 g8f6 b1c3 d5c4 a2a4 c8f5 e2e3 e7e6",
+    "d2d4 d7d5 c2c4 d5c4 g1f3 g8f6 e2e3 e7e6 f1c4 c7c5 e1g1 a7a6",
+    "d2d4 d7d5 g1f3 g8f6 c1f4 e7e6 e2e3 c7c5 c2c3 b8c6 b1d2 f8d6",
+    "d2d4 g8f6 c2c4 e7e6 b1c3 f8b4 e2e3 e8g8 f1d3 d7d5 g1f3 c7c5",
+    "d2d4 g8f6 c2c4 e7e6 g1f3 b7b6 g2g3 c8a6 b2b3 f8b4 c1d2 b4e7",
+    "d2d4 g8f6 c2c4 g7g6 b1c3 f8g7 e2e4 d7d6 g1f3 e8g8 f1e2 e7e5 e1g1 b8c6",
+    "d2d4 g8f6 c2c4 g7g6 b1c3 d7d5 c4d5 f6d5 e2e4 d5c3 b2c3 f8g7",
+    "d2d4 g8f6 c2c4 e7e6 g2g3 d7d5 f1g2 f8e7 g1f3 e8g8 e1g1 d5c4",
+    "d2d4 g8f6 c2c4 c7c5 d4d5 e7e6 b1c3 e6d5 c4d5 d7d6 e2e4 g7g6",
+    "d2d4 f7f5 g2g3 g8f6 f1g2 g7g6 g1f3 f8g7 e1g1 e8g8 c2c4 d7d6",
+    "c2c4 e7e5 b1c3 g8f6 g1f3 b8c6 g2g3 d7d5 c4d5 f6d5 f1g2 d5b6",
+    "c2c4 g8f6 b1c3 e7e6 g1f3 d7d5 d2d4 f8e7 c1g5 e8g8",
+    "c2c4 c7c5 b1c3 b8c6 g2g3 g7g6 f1g2 f8g7 g1f3 g8f6 e1g1 e8g8",
+    "g1f3 d7d5 g2g3 g8f6 f1g2 g7g6 e1g1 f8g7 d2d3 e8g8",
+    "g1f3 g8f6 c2c4 g7g6 b1c3 f8g7 e2e4 d7d6 d2d4 e8g8",
+)
+
+
+class OpeningBook:
+    """
+    Read-only view of a book file. Lookups binary-search the memory-mapped entries.
+    """
+
+    def __init__(self, path=BOOK_PATH):
+        self.file = open(path, "rb")
+        size = os.fstat(self.file.fileno()).st_size
+        # an empty file can't be mapped, it is simply a book without entries
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self.entry_count = size // ENTRY.size
+
+    def probe(self, key):
+        """
+        All (moveID, weight) pairs the book has for the position with this Zobrist key.
+        """
+        low, high = 0, self.entry_count
+        while low < high:  # find the first entry with a key >= key
+            middle = (low + high) // 2
+            if ENTRY.unpack_from(self.data, middle * ENTRY.size)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        entries = []
+        for index in range(low, self.entry_count):
+            entry_key, move_id, weight, learn = ENTRY.unpack_from(self.data, index * ENTRY.size)
+            if entry_key != key:
+                break
+            entries.append((move_id, weight))
+        return entries
+
+    def chooseMove(self, game_state, valid_moves):
+        """
+        Pick one of the book moves for the position at random, in proportion to their weights.
+        Returns None when the position is not in the book. Only moves found in valid_moves are played,
+        so a hash collision can never make the AI play an illegal move.
+        """
+        moves_by_id = {move.moveID: move for move in valid_moves}
+        candidates = [(moves_by_id[move_id], weight) for move_id, weight in self.probe(game_state.zobrist_key)
+                      if move_id in moves_by_id and weight > 0]
+        if not candidates:
+            return None
+        return random.choices([move for move, weight in candidates], [weight for move, weight in candidates])[0]
+
+    def close(self):
+        if self.entry_count:
+            self.data.close()
+        self.file.close()
+
+
+def findMove(game_state, move_name):
+    """
+    The valid move matching a move in long algebraic notation (e.g. e2e4, e7e8q), or None.
+    """
+    start = (Move.ranks_to_rows[move_name[1]], Move.files_to_cols[move_name[0]])
+    end = (Move.ranks_to_rows[move_name[3]], Move.files_to_cols[move_name[2]])
+    promotion_piece = move_name[4:].upper()
+    for move in game_state.getValidMoves():
+        if (move.start_row, move.start_col) == start and (move.end_row, move.end_col) == end and (
+                move.promotion_piece == promotion_piece):
+            return move
+    return None
+
+
+def buildBook(lines, path=BOOK_PATH):
+    """
+    Play through every line from the starting position and write a book file with one entry
+    per (position, move), weighted by the number of lines that play that move there.
+    Raises ValueError on a move that is not legal where the line plays it.
+    """
+    weights = {}
+    for line in lines:
+        game_state = GameState()
+        for move_name in line.split():
+            move = findMove(game_state, move_name)
+            if move is None:
+                raise ValueError("illegal move {} in book line {!r}".format(move_name, line))
+            entry = (game_state.zobrist_key, move.moveID)
+            weights[entry] = weights.get(entry, 0) + 1
+            game_state.makeMove(move)
+    # sorted by key for the binary search, the heaviest move of a position first as in Polyglot books
+    entries = sorted(weights.items(), key=lambda item: (item[0][0], -item[1]))
+    with open(path, "wb") as book_file:
+        for (key, move_id), weight in entries:
+            book_file.write(ENTRY.pack(key, move_id, min(weight, MAX_WEIGHT), 0))
+    return len(entries)
+
+
+if __name__ == "__main__":
+    print("wrote {} entries to {}".format(buildBook(BOOK_LINES), BOOK_PATH))
@@ -0,0 +1,77 @@
+import threading
+import numpy as np
+import pygame
+
+OVERLAY_BUFFERS = 8  # overlays the frames in flight can be holding at once, plus the newest
+
+
+class OverlayCompositor:
+    """
+    Puts the board overlay on the camera frames without allocating anything per frame.
+    The board surface is drawn into one of a few preallocated BGRA buffers at camera resolution, through a
+    pygame surface over the buffer's memory, and only when it changed. Frames share the current overlay until
+    it changes; a buffer is reused once every frame holding it has been released.
+    blend() mixes an overlay into the BGR camera frame in place, with the overlay's own per-pixel alpha.
+    """
+
+    def __init__(self, size, buffer_count=OVERLAY_BUFFERS):
+        width, height = size
+        self.size = size
+        self.buffers = [np.zeros((height, width, 4), np.uint8) for i in range(buffer_count)]
+        # SRCALPHA surfaces keep their pixels as BGRA in memory, so these have the board surface's format
+        self.surfaces = [pygame.image.frombuffer(buffer, size, "BGRA") for buffer in self.buffers]
+        self.references = [0] * buffer_count  # frames holding each buffer
+        self.current = None  # buffer with the newest overlay
+        self.outdated = False  # the screen changed but no buffer was free to draw it into
+        self.lock = threading.Lock()
+        self.scratch = threading.local()  # blend() work buffers, one set per compose thread
+
+    def render(self, screen, changed=True):
+        """
+        The buffer index of the overlay for a new frame, redrawn from screen if it changed.
+        Release it with release() once the frame is done with it.
+        """
+        with self.lock:
+            if changed or self.outdated or self.current is None:
+                free = [index for index, references in enumerate(self.references)
+                        if not references and index != self.current]
+                # with every buffer held (too few buffers for the pipeline) the frame gets the last overlay
+                self.outdated = not free and self.current is not None
+                if not self.outdated:
+                    index = free[0] if free else 0
+                    surface = self.surfaces[index]
+                    if screen.get_size() == self.size:
+                        # blitting onto transparent pixels copies them instead of blending
+                        surface.fill((0, 0, 0, 0))
+                        surface.blit(screen, (0, 0))
+                    else:
+                        pygame.transform.smoothscale(screen, self.size, surface)
+                    self.current = index
+            self.references[self.current] += 1
+            return self.current
+
+    def release(self, index):
+        with self.lock:
+            self.references[index] -= 1
+
+    def blend(self, image, index):
+        """Blends overlay index into the BGR image in place: image = overlay * alpha + image * (1 - alpha)"""
+        scratch = self.scratch
+        height, width, _ = image.shape
+        if getattr(scratch, "shape", None) != image.shape:
+            scratch.shape = image.shape
+            scratch.overlay = np.zeros((height, width, 3), np.uint16)
+            scratch.camera = np.zeros((height, width, 3), np.uint16)
+            scratch.inverse_alpha = np.zeros((height, width, 1), np.uint8)
+        overlay = self.buffers[index]
+        alpha = overlay[:, :, 3:]
+        np.multiply(overlay[:, :, :3], alpha, out=scratch.overlay, dtype=np.uint16)
+        np.subtract(255, alpha, out=scratch.inverse_alpha)
+        np.multiply(image, scratch.inverse_alpha, out=scratch.camera, dtype=np.uint16)
+        np.add(scratch.overlay, scratch.camera, out=scratch.overlay)
+        # divide by 255 with rounding: (x + 128 + ((x + 128) >> 8)) >> 8
+        np.add(scratch.overlay, 128, out=scratch.overlay)
+        np.right_shift(scratch.overlay, 8, out=scratch.camera)
+        np.add(scratch.overlay, scratch.camera, out=scratch.overlay)
+        np.right_shift(scratch.overlay, 8, out=scratch.overlay)
+        np.copyto(image, scratch.overlay, casting="unsafe")
@@ -0,0 +1,152 @@
+"""
+Perft: count the leaf nodes of the move tree to a fixed depth and compare them with the known counts.
+Checks that the move generator is correct and measures how fast it is. Only needs chess_engine,
+no camera, mediapipe or pygame.
+
+    python perft.py                      all positions, up to depth 3
+    python perft.py --depth 5 kiwipete   one position, deeper
+    python perft.py --divide 3 start     node count below every root move
+"""
+import argparse
+import sys
+import time
+from chess_engine import GameState
+
+DEFAULT_DEPTH = 3
+
+# name -> (FEN, node counts for depth 1, 2, 3, ...)
+# start to position6 are the usual perft test positions, the rest are edge cases for en-passant and castling,
+# all counts agree with other engines' move generators
+POSITIONS = {
+    "start": ("rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+              (20, 400, 8902, 197281, 4865609)),
+    "kiwipete": ("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+                 (48, 2039, 97862, 4085603)),
+    # en-passant captures that would leave the king on an open rank
+    "position3": ("8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+                  (14, 191, 2812, 43238, 674624, 11030083)),
+    # promotions, captures of castling rooks, castling out of reach
+    "position4": ("r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+                  (6, 264, 9467, 422333, 15833292)),
+    "position5": ("rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+                  (44, 1486, 62379, 2103487)),
+    "position6": ("r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+                  (46, 2079, 89890, 3894594)),
+    # en-passant capture that is illegal because it uncovers a check along the rank
+    "enpassant-pin": ("3k4/3p4/8/K1P4r/8/8/8/8 b - - 0 1",
+                      (18, 92, 1670, 10138, 185429)),
+    # en-passant capture that is illegal because it uncovers a check along the diagonal
+    "enpassant-diagonal": ("8/8/4k3/8/2p5/8/B2P2K1/8 w - - 0 1",
+                           (13, 102, 1266, 10276, 135655)),
+    # en-passant capture that gives check
+    "enpassant-check": ("8/8/1k6/2b5/2pP4/8/5K2/8 b - d3 0 1",
+                        (15, 126, 1928, 13931, 206379)),
+    "castle-kingside-check": ("5k2/8/8/8/8/8/8/4K2R w K - 0 1",
+                              (15, 66, 1198, 6399, 120330)),
+    "castle-queenside-check": ("3k4/8/8/8/8/8/8/R3K3 w Q - 0 1",
+                               (16, 71, 1286, 7418, 141077)),
+    # castling through and into attacked squares
+    "castle-attacked": ("r3k2r/1b4bq/8/8/8/8/7B/R3K2R w KQkq - 0 1",
+                        (26, 1141, 27826, 1274206)),
+}
+
+
+def perft(game_state, depth):
+    """
+    Number of move sequences of length depth from the current position.
+    The last ply is counted without making the moves.
+    """
+    moves = game_state.getValidMoves()
+    if depth <= 1:
+        return len(moves) if depth == 1 else 1
+    nodes = 0
+    for move in moves:
+        game_state.makeMove(move)
+        nodes += perft(game_state, depth - 1)
+        game_state.undoMove()
+    return nodes
+
+
+def divide(game_state, depth):
+    """
+    Perft split by root move: [(move in long algebraic notation, nodes), ...].
+    Comparing this with another engine's divide narrows a wrong count down to one move.
+    """
+    results = []
+    for move in game_state.getValidMoves():
+        game_state.makeMove(move)
+        results.append((getMoveName(move), perft(game_state, depth - 1)))
+        game_state.undoMove()
+    return results
+
+
+def getMoveName(move):
+    """
+    Long algebraic notation, e.g. e2e4 or a7a8q, the format other engines print divide in.
+    """
+    return (move.getRankFile(move.start_row, move.start_col) + move.getRankFile(move.end_row, move.end_col)
+            + move.promotion_piece.lower())
+
+
+def runPerft(name, max_depth):
+    """
+    Run perft on one position for every depth up to max_depth that has a known count.
+    Prints one line per depth and returns False if any count is wrong.
+    """
+    fen, expected_counts = POSITIONS[name]
+    game_state = GameState.from_fen(fen)
+    correct = True
+    for depth in range(1, min(max_depth, len(expected_counts)) + 1):
+        start_time = time.perf_counter()
+        nodes = perft(game_state, depth)
+        elapsed = time.perf_counter() - start_time
+        expected = expected_counts[depth - 1]
+        correct = correct and nodes == expected
+        print("{:<24} depth {:>2} {:>10} nodes {:>10} expected  {:<4} {:8.3f}s {:>10.0f} nps".format(
+            name, depth, nodes, expected, "OK" if nodes == expected else "FAIL", elapsed,
+            nodes / elapsed if elapsed > 0 else 0))
+    return correct
+
+
+def runDivide(name, depth):
+    """
+    Print the divide output of one position and the total.
+    """
+    game_state = GameState.from_fen(POSITIONS[name][0])
+    start_time = time.perf_counter()
+    results = divide(game_state, depth)
+    elapsed = time.perf_counter() - start_time
+    for move_name, nodes in sorted(results):
+        print("{}: {}".format(move_name, nodes))
+    total = sum(nodes for move_name, nodes in results)
+    print("\nmoves {}  nodes {}  {:.3f}s  {:.0f} nps".format(len(results), total, elapsed,
+                                                            total / elapsed if elapsed > 0 else 0))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Perft correctness and speed test of the chess engine.")
+    parser.add_argument("positions", nargs="*", metavar="position",
+                        help="positions to test, all of them if none are given: " + ", ".join(POSITIONS))
+    parser.add_argument("--depth", type=int, default=DEFAULT_DEPTH, help="deepest depth to count")
+    parser.add_argument("--divide", type=int, metavar="DEPTH", help="print the node count below every root move")
+    args = parser.parse_args()
+    names = args.positions or list(POSITIONS)
+    for name in names:
+        if name not in POSITIONS:
+            parser.error("unknown position {!r}".format(name))
+
+    if args.divide:
+        for name in names:
+            runDivide(name, args.divide)
+        return 0
+
+    start_time = time.perf_counter()
+    correct = True
+    for name in names:
+        correct = runPerft(name, args.depth) and correct
+    print("{} in {:.2f}s".format("all counts correct" if correct else "WRONG COUNTS", time.perf_counter() - start_time))
+    return 0 if correct else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())